@@ -0,0 +1,62 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2020 Released under the MIT license
+# Created on 2026-10-18
+
+__updated__ = "2026-10-18"
+__version__ = "0.1"
+
+# Measures the time from registering components until all of them are initialized and their
+# discovery messages are published, for different values of COMPONENTS_INIT_CONCURRENCY.
+# Each round discovers new components so every discovery message is sent to the broker.
+# Run on the device or unix port connected to a local broker after pysmartnode has been started:
+# import uasyncio as asyncio, _testing.benchmark_component_init as b; asyncio.create_task(b.run())
+
+from pysmartnode import config
+from pysmartnode.utils import component
+from pysmartnode.utils.component import ComponentBase, DISCOVERY_BINARY_SENSOR
+import uasyncio as asyncio
+import time
+import gc
+
+_mqtt = config.getMQTT()
+_count = 0
+
+
+class _Component(ComponentBase):
+    def __init__(self):
+        global _count
+        _count += 1
+        super().__init__("benchmark", __version__, _count, logger=config._log)
+        self._topic = _mqtt.getDeviceTopic("benchmark{!s}".format(_count))
+
+    async def _discovery(self, register=True):
+        name = "{!s}{!s}".format(self.COMPONENT_NAME, self._count)
+        if register:
+            await self._publishDiscovery("binary_sensor", self._topic, name,
+                                         DISCOVERY_BINARY_SENSOR)
+        else:
+            await self._deleteDiscovery("binary_sensor", name)
+
+
+async def _round(amount, concurrency):
+    config.COMPONENTS_INIT_CONCURRENCY = concurrency
+    while component._init_running:  # wait for components registered before
+        await asyncio.sleep_ms(10)
+    gc.collect()
+    mem = gc.mem_free()
+    t = time.ticks_ms()
+    comps = [_Component() for _ in range(amount)]
+    while component._init_running:
+        await asyncio.sleep_ms(10)
+    print("{!s} components with concurrency {!s} discovered after {!s}ms, "
+          "RAM free before {!s}".format(amount, concurrency,
+                                        time.ticks_diff(time.ticks_ms(), t), mem))
+    for c in comps:
+        await ComponentBase.removeComponent(c)
+
+
+async def run(amount=40, concurrencies=(1, 2, 4, 8)):
+    limit = config.COMPONENTS_INIT_CONCURRENCY
+    for c in concurrencies:
+        await _round(amount, c)
+    config.COMPONENTS_INIT_CONCURRENCY = limit
@@ -0,0 +1,85 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2020 Released under the MIT license
+# Created on 2026-10-18
+
+__updated__ = "2026-10-18"
+__version__ = "0.1"
+
+# Measures registering components and looking up their names with the component registry.
+# For comparison the previous algorithms (appending to a linked list by walking it and
+# a reverse linear scan of config.COMPONENTS) are run with the same amount of components.
+# Run on the unix port after pysmartnode has been started:
+# import uasyncio as asyncio, _testing.benchmark_components as b; asyncio.create_task(b.run())
+
+from pysmartnode import config
+from pysmartnode.utils.component import ComponentBase
+import uasyncio as asyncio
+import time
+import gc
+
+
+class _Component(ComponentBase):
+    def __init__(self, count):
+        super().__init__("benchmark", __version__, count, discover=False, logger=config._log)
+
+    async def _init_network(self):
+        pass  # only the registry is benchmarked, no log messages
+
+
+class _Node:
+    def __init__(self):
+        self._next_component = None
+
+
+def _linkedList(amount):
+    # registration as it was done before the registry
+    start = None
+    for _ in range(amount):
+        n = _Node()
+        if start is None:
+            start = n
+        else:
+            c = start
+            while c is not None:
+                if c._next_component is None:
+                    c._next_component = n
+                    break
+                c = c._next_component
+
+
+def _reverseScan(components, names):
+    for obj in names:
+        for comp in components:
+            if components[comp] == obj:
+                break
+
+
+async def run(amount=200):
+    gc.collect()
+    t = time.ticks_us()
+    comps = []
+    for i in range(amount):
+        c = _Component(i)
+        config.addComponent("benchmark{!s}".format(i), c)
+        comps.append(c)
+    reg = time.ticks_diff(time.ticks_us(), t)
+    t = time.ticks_us()
+    for c in comps:
+        config.getComponentName(c)
+    look = time.ticks_diff(time.ticks_us(), t)
+    gc.collect()
+    t = time.ticks_us()
+    _linkedList(amount)
+    old_reg = time.ticks_diff(time.ticks_us(), t)
+    t = time.ticks_us()
+    _reverseScan(config.COMPONENTS, comps)
+    old_look = time.ticks_diff(time.ticks_us(), t)
+    print("Registering {!s} components took {!s}us, linked list append {!s}us".format(
+        amount, reg, old_reg))
+    print("Looking up {!s} component names took {!s}us, reverse scan {!s}us".format(
+        amount, look, old_look))
+    await asyncio.sleep_ms(100)  # let the network initialization finish
+    for c in comps:
+        await ComponentBase.removeComponent(c)
+    del comps
+    gc.collect()
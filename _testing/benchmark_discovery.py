@@ -0,0 +1,53 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2020 Released under the MIT license
+# Created on 2026-10-18
+
+__updated__ = "2026-10-18"
+__version__ = "0.1"
+
+# Measures the RAM allocated while creating a sensor discovery message, once with str.format
+# and encoding it for publishing like before and once with the composer. The old way needs
+# 2 contiguous blocks of the message size, the composer only one and small fragments.
+# Run on the device or unix port after pysmartnode has been started:
+# import _testing.benchmark_discovery as b; b.run()
+
+import gc
+from pysmartnode.utils import sys_vars
+from pysmartnode.utils.component import ComponentBase
+from pysmartnode.utils.component.definitions import DISCOVERY_BASE, SENSOR_TEMPERATURE
+from pysmartnode.utils.component.composer import compose
+
+
+def _args():
+    return ("home/{!s}/benchmark0".format(sys_vars.getDeviceID()), "Temperature benchmark",
+            sys_vars.getDeviceID(), "benchmark0T", ComponentBase._composeAvailability(),
+            ComponentBase._composeSensorType(SENSOR_TEMPERATURE, "°C",
+                                             "{{ value_json.temperature }}", 600),
+            sys_vars.getDeviceDiscovery())
+
+
+def _format(args):
+    return DISCOVERY_BASE.format(*args).encode()
+
+
+def _compose(args):
+    return compose(DISCOVERY_BASE, *args)
+
+
+def _measure(func, args):
+    gc.collect()
+    start = gc.mem_alloc()
+    gc.disable()  # compose calls gc.collect() itself but the difference stays meaningful
+    msg = func(args)
+    allocated = gc.mem_alloc() - start
+    gc.enable()
+    return len(msg), allocated
+
+
+def run():
+    args = _args()
+    size, f = _measure(_format, args)
+    _, c = _measure(_compose, args)
+    print("Discovery message of {!s} Bytes allocated: format {!s} Bytes, "
+          "composer {!s} Bytes".format(size, f, c))
+    return size, f, c
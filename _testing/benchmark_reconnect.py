@@ -0,0 +1,52 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2020 Released under the MIT license
+# Created on 2026-10-18
+
+__updated__ = "2026-10-18"
+__version__ = "0.1"
+
+# Measures the time needed to subscribe all topics like after a reconnect,
+# once subscribing one by one and once using MQTT_SUBSCRIBE_BATCH_SIZE.
+# Run on the device or unix port after pysmartnode has connected to the broker:
+# import uasyncio as asyncio, _testing.benchmark_reconnect as b; asyncio.create_task(b.run())
+
+from pysmartnode import config
+import uasyncio as asyncio
+import time
+import gc
+
+_mqtt = config.getMQTT()
+
+
+class _Benchmark:
+    pass  # only used to identify the subscriptions of the benchmark
+
+
+def _cb(topic, msg, retain):
+    return False
+
+
+async def _resubscribe():
+    await _mqtt.awaitSubscriptionsDone()
+    t = time.ticks_ms()
+    _mqtt._sub_task = asyncio.create_task(_mqtt._subscribeTopics())
+    _mqtt._sub_done.clear()
+    await _mqtt.awaitSubscriptionsDone()
+    return time.ticks_diff(time.ticks_ms(), t)
+
+
+async def run(amounts=(10, 50, 200)):
+    component = _Benchmark()
+    batch_size = config.MQTT_SUBSCRIBE_BATCH_SIZE
+    for amount in amounts:
+        for i in range(amount):
+            _mqtt.subscribeSync(_mqtt.getDeviceTopic("benchmark/{!s}".format(i)), _cb, component)
+        gc.collect()
+        config.MQTT_SUBSCRIBE_BATCH_SIZE = 0
+        serial = await _resubscribe()
+        config.MQTT_SUBSCRIBE_BATCH_SIZE = batch_size
+        batched = await _resubscribe()
+        print("Subscriptions:", _mqtt.getLenSubscribtions(), "serial: {!s}ms".format(serial),
+              "batched: {!s}ms".format(batched))
+        await _mqtt.unsubscribe(None, component)
+        gc.collect()
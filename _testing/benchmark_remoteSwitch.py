@@ -0,0 +1,53 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2020 Released under the MIT license
+# Created on 2026-10-18
+
+__updated__ = "2026-10-18"
+__version__ = "0.1"
+
+# Checks that the event loop stays responsive while RemoteSwitch commands wait for an answer.
+# Sends commands to remote switches that never answer and measures the longest delay of a
+# task sleeping 10ms in the meantime. Then answers a command and measures the reaction time.
+# Run on the device or unix port after pysmartnode has connected to the broker:
+# import uasyncio as asyncio, _testing.benchmark_remoteSwitch as b; asyncio.create_task(b.run())
+
+from pysmartnode import config
+from pysmartnode.components.switches.remoteSwitch import RemoteSwitch
+import uasyncio as asyncio
+import time
+
+_mqtt = config.getMQTT()
+
+
+async def _ticker(res):
+    t = time.ticks_ms()
+    while True:
+        await asyncio.sleep_ms(10)
+        n = time.ticks_ms()
+        res[0] = max(res[0], time.ticks_diff(n, t) - 10)
+        t = n
+
+
+async def run(amount=5, timeout=2):
+    switches = [RemoteSwitch(_mqtt.getDeviceTopic("benchmark/rs{!s}/set".format(i)),
+                             _mqtt.getDeviceTopic("benchmark/rs{!s}".format(i)), timeout) for i
+                in range(amount)]
+    await _mqtt.awaitSubscriptionsDone()
+    res = [0]
+    ticker = asyncio.create_task(_ticker(res))
+    t = time.ticks_ms()
+    answers = [await task for task in [asyncio.create_task(s.on()) for s in switches]]
+    print("{!s} unanswered commands took {!s}ms, results {!s}, max loop delay {!s}ms".format(
+        amount, time.ticks_diff(time.ticks_ms(), t), answers, res[0]))
+    s = switches[0]
+    res[0] = 0
+    t = time.ticks_ms()
+    task = asyncio.create_task(s.on())
+    await asyncio.sleep_ms(100)
+    await _mqtt.publish(s._state_topic, "ON", qos=1)
+    answer = await task
+    print("Answered command returned {!s} after {!s}ms, max loop delay {!s}ms".format(
+        answer, time.ticks_diff(time.ticks_ms(), t), res[0]))
+    ticker.cancel()
+    for s in switches:
+        await RemoteSwitch.removeComponent(s)
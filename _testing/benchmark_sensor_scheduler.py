@@ -0,0 +1,50 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2020 Released under the MIT license
+# Created on 2026-10-18
+
+__updated__ = "2026-10-18"
+__version__ = "0.1"
+
+# Measures the scheduler reading all sensors: amount of readings, wakeups of the scheduler task
+# per minute and the smallest distance between readings of different sensors.
+# Before, every sensor had its own loop task waking up every 500ms, so 120 wakeups per minute
+# and sensor, and all sensors with the same interval were read at the same time.
+# Run on the device or unix port after pysmartnode has been started:
+# import uasyncio as asyncio, _testing.benchmark_sensor_scheduler as b; asyncio.create_task(b.run())
+
+from pysmartnode.utils.component.sensor import ComponentSensor, SENSOR_TEMPERATURE, _scheduler
+import uasyncio as asyncio
+import time
+
+_reads = []
+
+
+class _Sensor(ComponentSensor):
+    def __init__(self, i, interval_reading):
+        super().__init__("BenchmarkSensor", __version__, i, discover=False,
+                         interval_reading=interval_reading, interval_publish=-1)
+        self._addSensorType(SENSOR_TEMPERATURE, 0, 0, "{{ value_json.temperature }}", "°C")
+
+    async def _read(self):
+        _reads.append(time.ticks_ms())
+        await self._setValue(SENSOR_TEMPERATURE, 20, log_error=False)
+
+
+async def run(amount=10, interval=1, duration=10):
+    sensors = [_Sensor(i, interval) for i in range(amount)]
+    await asyncio.sleep_ms(_START_WAIT)  # wait for the first readings to get spread
+    _reads.clear()
+    w = _scheduler.wakeups
+    await asyncio.sleep(duration)
+    wakeups = _scheduler.wakeups - w
+    reads = sorted(_reads)
+    dist = min(time.ticks_diff(reads[i + 1], reads[i]) for i in range(len(reads) - 1))
+    print("{!s} sensors, {!s}s interval: {!s} readings, {!s} scheduler wakeups per minute "
+          "(loop per sensor: {!s}), smallest distance between readings {!s}ms".format(
+        amount, interval, len(reads), wakeups * 60 // duration, amount * 120, dist))
+    for s in sensors:
+        await ComponentSensor.removeComponent(s)
+    return len(reads), wakeups, dist
+
+
+_START_WAIT = 5000
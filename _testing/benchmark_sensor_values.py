@@ -0,0 +1,52 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2020 Released under the MIT license
+# Created on 2026-10-18
+
+__updated__ = "2026-10-18"
+__version__ = "0.1"
+
+# Measures the RAM used per sensor_type by sensor objects with 12 sensor_types (like a PMS5003).
+# Compares a dict of 12-element lists per object like before with the current storage
+# sharing the static metadata between objects of the same sensor.
+# Run on the device or unix port after pysmartnode has been started:
+# import _testing.benchmark_sensor_values as b; b.run()
+
+import gc
+from pysmartnode.utils.component.sensor import ComponentSensor
+
+_TYPES = ["pm{!s}".format(i) for i in range(12)]
+
+
+class _Sensor(ComponentSensor):
+    def __init__(self, i):
+        super().__init__("BenchmarkSensor", __version__, i, discover=False, interval_reading=-1,
+                         interval_publish=-1)
+
+
+def _old(obj):
+    obj.values = {}
+    for t in _TYPES:
+        obj.values[t] = [0, 0.0, "{{ value_json.pm }}", "µg/m³", None, None, None, False, None,
+                         False, None, None]
+
+
+def _new(obj):
+    for t in _TYPES:
+        obj._addSensorType(t, 0, 0, "{{ value_json.pm }}", "µg/m³")
+
+
+def _measure(func, objects):
+    gc.collect()
+    start = gc.mem_alloc()
+    for obj in objects:
+        func(obj)
+    gc.collect()
+    return (gc.mem_alloc() - start) / len(objects) / len(_TYPES)
+
+
+def run(amount=2):
+    objects = [_Sensor(i) for i in range(amount)]
+    res = (_measure(_old, objects), _measure(_new, objects))
+    print("{!s} objects, bytes per sensor_type: dict of lists {:.1f}, "
+          "shared metadata {:.1f}".format(amount, *res))
+    return res
@@ -0,0 +1,73 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2020 Released under the MIT license
+# Created on 2026-10-18
+
+__updated__ = "2026-10-18"
+__version__ = "0.2"
+
+# Micro-benchmark comparing the linear scan over all subscriptions using
+# MQTTHandler.matchesSubscription with the lookup in the SubscriptionTree.
+# Run on the device or unix port after pysmartnode has been started:
+# import _testing.benchmark_subscriptions as b; b.run()
+
+import time
+import gc
+from pysmartnode.networking.mqtt import MQTTHandler
+from pysmartnode.networking.subscriptions import SubscriptionTree
+
+_CHECK_STATE = 4  # flag of mqtt.py, const with underscore can't be imported
+_JSON = MQTTHandler.PAYLOAD_JSON
+_STR = MQTTHandler.PAYLOAD_STR
+
+
+def _subscriptions(amount):
+    # (topic, callback, component, flags) like created by MQTTHandler.subscribeSync
+    subs = []
+    for i in range(amount):
+        m = i % 6
+        if m == 0:
+            subs.append(("./switch{!s}/set".format(i), None, None, _STR | _CHECK_STATE))
+        elif m == 1:
+            subs.append(("./sensor{!s}/interval/set".format(i), None, None, _JSON))
+        elif m == 2:
+            subs.append(("./easyGPIO/{!s}/+/set".format(i), None, None, _JSON))
+        elif m == 3:
+            subs.append(("home/remote{!s}/temperature".format(i), None, None, _JSON))
+        elif m == 4:
+            subs.append(("./Climate{!s}/statem/set".format(i), None, None, _STR))
+        else:
+            subs.append(("home/login/node{!s}/#".format(i), None, None, _JSON))
+    return subs
+
+
+_TOPICS = ("./switch0/set", "./switch6", "./easyGPIO/2/4/set", "home/remote3/temperature",
+           "home/login/node5/component", "home/unknown/topic")
+
+
+def run(amount=60, iterations=200):
+    subs = _subscriptions(amount)
+    topics = _TOPICS
+    tree = SubscriptionTree()
+    for sub in subs:
+        tree.add(sub[0], sub)
+        if sub[3] & _CHECK_STATE:
+            tree.add(sub[0][:-4], sub, state_topic=True)
+    matches = MQTTHandler.matchesSubscription
+    gc.collect()
+    t = time.ticks_us()
+    for _ in range(iterations):
+        for topic in topics:
+            for sub in subs:
+                matches(topic, sub[0], ignore_command=bool(sub[3] & _CHECK_STATE))
+    linear = time.ticks_diff(time.ticks_us(), t) / (iterations * len(topics))
+    gc.collect()
+    res = []  # reused like in MQTTHandler._dispatch
+    t = time.ticks_us()
+    for _ in range(iterations):
+        for topic in topics:
+            tree.match(topic, res)
+            res.clear()
+    indexed = time.ticks_diff(time.ticks_us(), t) / (iterations * len(topics))
+    print("Subscriptions:", amount, "linear scan: {:.1f}us".format(linear),
+          "tree: {:.1f}us".format(indexed), "per message")
+    return linear, indexed
@@ -0,0 +1,63 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2020 Released under the MIT license
+# Created on 2026-10-18
+
+__updated__ = "2026-10-18"
+__version__ = "0.1"
+
+# Measures the bytes allocated for resolving topics when publishing and receiving messages,
+# once by formatting the topics on every call like before and once using compiled topics.
+# Run on the unix port (or device) after pysmartnode has been started:
+# import _testing.benchmark_topics as b; b.run()
+
+import gc
+from pysmartnode import config
+
+_mqtt = config.getMQTT()
+
+
+def _realTopicFormat(device_topic):
+    return "{}/{}/{}".format(_mqtt.mqtt_home, _mqtt.client_id, device_topic[2:])
+
+
+def _receivedTopicFormat(topic):
+    topic = topic.decode()
+    if topic.startswith("{!s}/{!s}/".format(_mqtt.mqtt_home, _mqtt.client_id)):
+        topic = topic.replace("{!s}/{!s}/".format(_mqtt.mqtt_home, _mqtt.client_id), "./")
+    return topic
+
+
+def _receivedTopicCompiled(topic):
+    t = _mqtt._device_topics.get(topic)
+    if t is None:
+        topic = topic.decode()
+        if _mqtt._isDeviceSubscription(topic):
+            topic = _mqtt._convertToDeviceTopic(topic)
+        return topic
+    return t
+
+
+def _measure(func, arg, iterations):
+    gc.collect()
+    gc.disable()
+    start = gc.mem_alloc()
+    for _ in range(iterations):
+        func(arg)
+    allocated = gc.mem_alloc() - start
+    gc.enable()
+    gc.collect()
+    return allocated / iterations
+
+
+def run(iterations=100):
+    device_topic = _mqtt.getDeviceTopic("benchmark0/temperature")
+    real_topic = _mqtt.compileTopic(device_topic)
+    received = real_topic.encode()
+    res = (_measure(_realTopicFormat, device_topic, iterations),
+           _measure(_mqtt.getRealTopic, real_topic, iterations),
+           _measure(_receivedTopicFormat, received, iterations),
+           _measure(_receivedTopicCompiled, received, iterations))
+    _mqtt._releaseTopic(device_topic)
+    print("Bytes allocated per publish topic: format {:.1f}, compiled {:.1f}".format(*res[:2]))
+    print("Bytes allocated per received topic: format {:.1f}, compiled {:.1f}".format(*res[2:]))
+    return res
@@ -34,8 +34,8 @@ cooling_unit
 fan_unit
 """
 
-__updated__ = "2020-09-01"
-__version__ = "0.94"
+__updated__ = "2026-10-18"
+__version__ = "0.95"
 
 from pysmartnode import config
 from pysmartnode import logging
@@ -43,6 +43,7 @@ import uasyncio as asyncio
 import gc
 import time
 from pysmartnode.utils.component import ComponentBase
+from pysmartnode.utils.component.composer import compose
 
 # imports of ComponentSensor and ComponentSwitch to keep heap fragmentation low
 # as those will be needed in any case
@@ -322,21 +323,18 @@ class Climate(ComponentBase):
         modes = ujson.dumps([str(mode) for mode in self._modes])
         gc.collect()
         if register:
-            sens = CLIMATE_DISCOVERY.format(base_topic, self._frn or name,
-                                            self._composeAvailability(),
-                                            sys_vars.getDeviceID(), name,  # unique_id
-                                            _mqtt.getRealTopic(
-                                                self.temp_sensor.getTopic(SENSOR_TEMPERATURE)),
-                                            # current_temp_topic
-                                            self.temp_sensor.getTemplate(SENSOR_TEMPERATURE),
-                                            # cur_temp_template
-                                            self._temp_step,
-                                            self._min_temp + (
-                                                self._tolerance if self._stemp else 0),
-                                            self._max_temp - (
-                                                self._tolerance if self._stemp else 0), modes,
-                                            CLIMATE_DISCOVERY_STEMP if self._stemp else CLIMATE_DISCOVERY_HILOW,
-                                            sys_vars.getDeviceDiscovery())
+            sens = compose(CLIMATE_DISCOVERY, base_topic, self._frn or name,
+                           self._composeAvailability(),
+                           sys_vars.getDeviceID(), name,  # unique_id
+                           _mqtt.getRealTopic(self.temp_sensor.getTopic(SENSOR_TEMPERATURE)),
+                           # current_temp_topic
+                           self.temp_sensor.getTemplate(SENSOR_TEMPERATURE),
+                           # cur_temp_template
+                           self._temp_step,
+                           self._min_temp + (self._tolerance if self._stemp else 0),
+                           self._max_temp - (self._tolerance if self._stemp else 0), modes,
+                           CLIMATE_DISCOVERY_STEMP if self._stemp else CLIMATE_DISCOVERY_HILOW,
+                           sys_vars.getDeviceDiscovery())
         else:
             sens = ""
         gc.collect()
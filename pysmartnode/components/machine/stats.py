@@ -5,8 +5,8 @@
 # This component will be started automatically to provide basic device statistics.
 # You don't need to configure it to be active.
 
-__updated__ = "2020-04-03"
-__version__ = "1.71"
+__updated__ = "2026-10-18"
+__version__ = "1.8"
 
 import gc
 
@@ -106,13 +106,25 @@ class STATS(ComponentBase):
         val["MQTT Downtime"] = '{:d}T{:02d}:{:02d}:{:02d}'.format(d, h, m, s)
         val["MQTT Reconnects"] = _mqtt.getReconnects()
         val["MQTT Subscriptions"] = _mqtt.getLenSubscribtions()
+        val["MQTT Dropped Publications"] = _mqtt.getDroppedPublications()
         if config.DEBUG:
             # only needed for debugging and could be understood wrongly otherwise
             val["MQTT TimedOutOps"] = _mqtt.getTimedOutOperations()
             val["MQTT Repubs"] = _mqtt.REPUB_COUNT
+            val["MQTT Coalesced Publications"] = _mqtt.getCoalescedPublications()
         await _mqtt.publish(_mqtt.getDeviceTopic("status"), val, qos=1, retain=False, timeout=5)
         del val
         gc.collect()
+        stats = _mqtt.getTopicStats()
+        if stats is not None:
+            # separate diagnostics topic as it can get big and isn't useful in homeassistant
+            from pysmartnode.networking.mqtt_stats import BUCKETS
+            val = stats.report()
+            val["buckets_ms"] = BUCKETS
+            await _mqtt.publish(_mqtt.getDeviceTopic("status/mqtt"), val, qos=1, retain=False,
+                                timeout=5)
+            del val
+            gc.collect()
         if config.DEBUG:
             # DEBUG to check RAM/Heap fragmentation
             import micropython
@@ -31,14 +31,13 @@ Put a Resistor (~10kR) between the power pin (or permanent power) and the adc pi
 Connect the wires to the adc pin and gnd.
 """
 
-__updated__ = "2020-04-03"
-__version__ = "1.8"
+__updated__ = "2026-10-18"
+__version__ = "1.9"
 
 from pysmartnode import config
 from pysmartnode import logging
 from pysmartnode.components.machine.adc import ADC
 from pysmartnode.components.machine.pin import Pin
-import uasyncio as asyncio
 import gc
 import machine
 import time
@@ -69,7 +68,6 @@ class WaterSensor(ComponentSensor):
         self._lv = None
         self._addSensorType(SENSOR_BINARY_MOISTURE, 0, 0, VALUE_TEMPLATE, "", friendly_name,
                             self._topic, None, True)
-        self._pub_task = None
 
     async def _read(self):
         a = time.ticks_us()
@@ -85,22 +83,16 @@ class WaterSensor(ComponentSensor):
             state = False
             if self._lv != state:
                 # dry
-                if self._pub_task is not None:
-                    self._pub_task.cancel()
-                self._pub_task = asyncio.create_task(
-                    _mqtt.publish(self.getTopic(SENSOR_BINARY_MOISTURE), "OFF", qos=1,
-                                  retain=True, timeout=None, await_connection=True))
+                _mqtt.schedulePublish(self.getTopic(SENSOR_BINARY_MOISTURE), "OFF", qos=1,
+                                      retain=True)
 
             self._lv = state
         else:
             state = True
             if self._lv != state:
                 # wet
-                if self._pub_task is not None:
-                    self._pub_task.cancel()
-                self._pub_task = asyncio.create_task(
-                    _mqtt.publish(self.getTopic(SENSOR_BINARY_MOISTURE), "ON", qos=1,
-                                  retain=True, timeout=None, await_connection=True))
+                _mqtt.schedulePublish(self.getTopic(SENSOR_BINARY_MOISTURE), "ON", qos=1,
+                                      retain=True)
             self._lv = state
         b = time.ticks_us()
         if WaterSensor.DEBUG:
@@ -19,8 +19,8 @@ NOTE: additional constructor arguments are available from base classes, check CO
 # TODO: implement possibility to set sensor topics through mqtt, similar to RemoteSensor implementation
 # TODO: make a real ComponentSwitch class so type checks won't fail
 
-__updated__ = "2020-03-29"
-__version__ = "0.3"
+__updated__ = "2026-10-18"
+__version__ = "0.5"
 
 COMPONENT_NAME = "RemoteSwitch"
 
@@ -49,45 +49,64 @@ class RemoteSwitch(ComponentBase):
         self._topic = command_topic
         self._state_topic = state_topic
         self.lock = asyncio.Lock()
-        # in case switch activates a device that will need a while to finish
-        self._state_time = 0
+        self._state_count = 0  # received states, to recognize the answer to a command
+        self._state_event = asyncio.Event()  # set on every received state
         self._timeout = timeout
-        _mqtt.subscribeSync(self._state_topic, self.on_message, self)
+        _mqtt.subscribeSync(self._state_topic, self.on_message, self,
+                            payload_type=_mqtt.PAYLOAD_STR)
 
     async def on_message(self, topic, msg, retain):
         """
         Standard callback to change the device state from mqtt.
         Can be subclassed if extended functionality is needed.
+        Payload is received as str, see _mqtt.PAYLOAD_STR. Accepted payloads are
+        "ON", "True", "true", "1" and "OFF", "False", "false", "0" (_mqtt.payload_on/off).
         """
         if msg in _mqtt.payload_on:
             self._state = True
-            self._state_time = time.ticks_ms()
         elif msg in _mqtt.payload_off:
             self._state = False
-            self._state_time = time.ticks_ms()
         else:
             raise TypeError("Payload {!s} not supported".format(msg))
+        self._state_count += 1
+        self._state_event.set()
         return False  # will not publish the requested state to mqtt as already done by on()/off()
 
-    async def on(self):
-        """Turn switch on. Can be used by other components to control this component"""
+    async def _command(self, msg):
+        """
+        Publish a command and wait for the first state received after the command was sent.
+        Commands of one switch are sent one after another, different switches don't block
+        each other or the event loop while waiting for an answer.
+        :return: True if a state was received before the timeout, False otherwise
+        """
         async with self.lock:
             t = time.ticks_ms()
-            await _mqtt.publish(self._topic, "ON", qos=1, timeout=self._timeout)
-            while time.ticks_diff(time.ticks_ms(), t) < self._timeout * 1000:
-                if t < self._state_time:  # received new state
-                    return self._state
-            return False  # timeout reached
+            count = self._state_count
+            self._state_event.clear()
+            if not await _mqtt.publish(self._topic, msg, qos=1, timeout=self._timeout):
+                return False  # timeout or no connection
+            while self._state_count == count:
+                left = self._timeout * 1000 - time.ticks_diff(time.ticks_ms(), t)
+                if left <= 0:
+                    return False
+                try:
+                    await asyncio.wait_for_ms(self._state_event.wait(), int(left))
+                except asyncio.TimeoutError:
+                    return False
+                self._state_event.clear()
+            return True
+
+    async def on(self):
+        """Turn switch on. Can be used by other components to control this component"""
+        if await self._command("ON"):
+            return self._state
+        return False  # timeout reached
 
     async def off(self):
         """Turn switch off. Can be used by other components to control this component"""
-        async with self.lock:
-            t = time.ticks_ms()
-            await _mqtt.publish(self._topic, "OFF", qos=1, timeout=self._timeout)
-            while time.ticks_diff(time.ticks_ms(), t) < self._timeout * 1000:
-                if t < self._state_time:  # received new state
-                    return True if self._state is False else False
-            return False  # timeout reached
+        if await self._command("OFF"):
+            return True if self._state is False else False
+        return False  # timeout reached
 
     async def toggle(self):
         """Toggle device state. Can be used by other component to control this component"""
@@ -6,7 +6,7 @@
 # Configuration management file
 ##
 
-__updated__ = "2020-04-02"
+__updated__ = "2026-10-18"
 
 from .config_base import *
 from sys import platform
@@ -55,6 +55,7 @@ gc.collect()
 __printRAM(_mem, "Imported MQTTHandler")
 
 COMPONENTS = {}  # dictionary of all configured components
+_component_names = {}  # {component: name}, reverse index of COMPONENTS
 _mqtt = MQTTHandler()
 gc.collect()
 __printRAM(_mem, "Created MQTT")
@@ -92,10 +93,7 @@ def getComponent(name):
 
 
 def getComponentName(component):
-    for comp in COMPONENTS:
-        if COMPONENTS[comp] == component:
-            return comp
-    return None
+    return _component_names.get(component)
 
 
 def addComponent(name, obj):
@@ -106,6 +104,17 @@ def addComponent(name, obj):
     if name in COMPONENTS:
         raise ValueError("Component {!s} already registered, can't add".format(name))
     COMPONENTS[name] = obj
+    _component_names[obj] = name
+
+
+def removeComponent(obj):
+    """
+    Remove a component from the list of accessible components.
+    Called when a component gets removed during runtime.
+    """
+    name = _component_names.pop(obj, None)
+    if name is not None and COMPONENTS.get(name) is obj:
+        del COMPONENTS[name]
 
 
 def getMQTT():
@@ -119,5 +128,5 @@ __printRAM(_mem, "Imported Component base class")
 from pysmartnode.components.machine.stats import STATS
 
 __printRAM(_mem, "Imported .machine.stats")
-COMPONENTS["STATS"] = STATS()
+addComponent("STATS", STATS())
 __printRAM(_mem, "Created .machine.stats.STATS")
@@ -2,7 +2,7 @@
 # Copyright Kevin Köck 2019-2020 Released under the MIT license
 # Created on 2019-10-22 
 
-__updated__ = "2020-08-18"
+__updated__ = "2026-10-18"
 
 from sys import platform
 from micropython import const
@@ -21,16 +21,71 @@ MQTT_HOME = "home"
 MQTT_AVAILABILITY_SUBTOPIC = "available"  # will be generated to MQTT_HOME/<device-id>/MQTT_AVAILABILITY_SUBTOPIC
 MQTT_DISCOVERY_PREFIX = "homeassistant"
 MQTT_DISCOVERY_ENABLED = True
+MQTT_DISCOVERY_CACHE = False
+# DISCOVERY_CACHE: Store hashes of the published discovery messages in a file and don't publish
+# unchanged ones again after a reset because the broker retains them. All discovery messages are
+# published again when Home-Assistant publishes "online" to <MQTT_DISCOVERY_PREFIX>/status.
+MQTT_DISCOVERY_DEVICE = False
+# DISCOVERY_DEVICE: Publish all entities of the device in one device discovery message to
+# <MQTT_DISCOVERY_PREFIX>/device/<device-id>/config instead of one message per entity.
+# Needs Home-Assistant 2024.11 or newer. Components with their own discovery format like
+# climate still publish separately. Each entity needs ~200 Bytes of RAM.
 MQTT_RECEIVE_CONFIG = False
 # RECEIVE_CONFIG: Only use if you run the "SmartServer" in your environment which
 # sends the configuration of a device over mqtt
 # If you do not run it, you have to configure the components locally on each microcontroller
 # using a components.py file
 MQTT_TYPE = const(1)  # 1: direct, 0: IOT implementation (not working at the moment, use direct)
-MQTT_MAX_CONCURRENT_EXECUTIONS = -1
-# MAX_CONCURRENT_EXECUTIONS: Can be used to restrict the amount of concurrently executed mqtt
-# messages to prevent message spam to crash the device.
+MQTT_CALLBACK_WORKERS = const(3)
+# CALLBACK_WORKERS: Amount of tasks executing the callbacks of received messages. Messages of
+# the same subscription are executed in order, messages of different subscriptions concurrently.
+# A callback waiting for another received message (e.g. a RemoteSwitch) occupies one worker.
+# If all workers wait for received messages (e.g. Climate callbacks switching RemoteSwitches),
+# the awaited messages can't be executed until the callbacks time out. Increase the amount of
+# workers if such callbacks are used. Replaces MQTT_MAX_CONCURRENT_EXECUTIONS (unlimited).
+MQTT_CALLBACK_QUEUE_SIZE = const(20)
+# CALLBACK_QUEUE_SIZE: Maximum amount of received messages waiting to be executed. Prevents
+# message spam from crashing the device.
 # However there is no safety against crashing the device with very long messages.
+MQTT_CALLBACK_OVERFLOW = const(2)
+# CALLBACK_OVERFLOW: What to do if the callback queue is full: 0: drop oldest message,
+# 1: drop newest message, 2: replace a queued message of the same subscription and topic,
+# otherwise drop the newest message, so messages of other subscriptions are never dropped.
+MQTT_LOCAL_LOOPBACK = False
+# LOCAL_LOOPBACK: Publications matching subscriptions of this device are delivered to them
+# directly, not only once the broker sends them back. Works without connection to the broker.
+# The message sent back by the broker is ignored. Subscribers receive it as non-retained message.
+MQTT_SUBSCRIBE_BATCH_SIZE = const(512)
+# SUBSCRIBE_BATCH_SIZE: Subscriptions are sent without waiting for the acknowledgement of the
+# previous one until the combined length of the pending topics reaches this size (in bytes).
+# Reduces the time needed to subscribe all topics after a reconnect. 0 subscribes one by one.
+MQTT_DEVICE_WILDCARD = False
+# DEVICE_WILDCARD: Subscribe <home>/<device-id>/# once instead of each device topic separately,
+# only topics of other devices are subscribed individually. Makes reconnects faster and reduces
+# subscriptions on the broker but the device receives all messages published to its
+# device topics, including its own sensor readings and states.
+MQTT_PUBLISH_QUEUE_SIZE = const(16)
+# PUBLISH_QUEUE_SIZE: Maximum amount of messages waiting in the queue of
+# MQTTHandler.schedulePublish. Retained messages replace queued messages of the same topic.
+# If the queue is full, the oldest non-retained message will be dropped.
+MQTT_STORE_FORWARD_SIZE = const(0)
+# STORE_FORWARD_SIZE: Size in bytes of a file on the flash that stores sensor readings while the
+# broker is not reachable. After reconnecting they get published with their original timestamp
+# to <sensor topic>/stored. If the file is full, the oldest readings get overwritten. 0 disables.
+MQTT_STORE_FORWARD_INTERVAL = const(200)
+# STORE_FORWARD_INTERVAL: Pause in ms between the publications of stored readings.
+MQTT_STATS_TOPICS = const(0)
+# STATS_TOPICS: Maximum amount of topics with performance counters (messages, bytes, callback
+# and publish latency histograms), published by the STATS component to <home>/<device-id>/status/mqtt.
+# Further topics are counted as "other". Discovery and log publications are counted together
+# as "discovery" and "log". Each topic needs ~150 Bytes of RAM. 0 disables.
+COMPONENTS_INIT_CONCURRENCY = 1 if platform == "esp8266" else 4
+# INIT_CONCURRENCY: Amount of components whose network initialization (log message, discovery
+# messages) runs concurrently after registration. Higher values make all components available
+# sooner but need more RAM. 1 initializes one component after another.
+COMPONENTS_INIT_MIN_FREE_RAM = const(16000)
+# INIT_MIN_FREE_RAM: Another network initialization is only started concurrently if at least
+# this amount of RAM (in bytes) is free. Otherwise it waits for a running one to finish.
 
 WIFI_LED = None  # set a pin number to have the wifi state displayed by a blinking led. Useful for devices like sonoff
 WIFI_LED_ACTIVE_HIGH = True  # if led is on when output is low, change to False
@@ -2,31 +2,35 @@
 # Copyright Kevin Köck 2017-2020 Released under the MIT license
 # Created on 2017-07-19
 
-__updated__ = "2019-11-02"
-__version__ = "2.9"
+__updated__ = "2026-10-18"
+__version__ = "3.0"
 
 # TODO: Add possibility to use real logging module on esp32 and save logs locally or to sdcard
 
 import gc
 from pysmartnode.utils import sys_vars
 from pysmartnode import config
-import uasyncio as asyncio
 
 gc.collect()
 import time
 
 
+def _compose(name, level, *message):
+    topic = "{!s}/log/{!s}/{!s}".format(config.MQTT_HOME, level, sys_vars.getDeviceID())
+    # if level is before id other clients can subscribe to e.g. all critical logs
+    message = (b"{} " * (len(message) + 1)).format("[{}]".format(name), *message)
+    # format message as bytes so there's no need to encode it later.
+    return topic, message
+
+
 async def asyncLog(name, level, *message, timeout=None, await_connection=True):
     if level == "debug" and not config.DEBUG:  # ignore debug messages if debug is disabled
         return
     if config.getMQTT():
-        base_topic = "{!s}/log/{!s}/{!s}".format(config.MQTT_HOME, "{!s}", sys_vars.getDeviceID())
-        # if level is before id other clients can subscribe to e.g. all critical logs
-        message = (b"{} " * (len(message) + 1)).format("[{}]".format(name), *message)
+        topic, message = _compose(name, level, *message)
         gc.collect()
-        await config.getMQTT().publish(base_topic.format(level), message, qos=1, timeout=timeout,
+        await config.getMQTT().publish(topic, message, qos=1, timeout=timeout,
                                        await_connection=await_connection)
-        # format message as bytes so there's no need to encode it later.
 
 
 def log(name, level, *message, local_only=False, return_only=False, timeout=None):
@@ -44,9 +48,9 @@ def log(name, level, *message, local_only=False, return_only=False, timeout=None
         print("[{!s}] [{!s}]".format(name, level), *message)
     if return_only:
         return
-    if not local_only:
-        asyncio.create_task(asyncLog(name, level, *message, timeout=timeout,
-                                                      await_connection=True))
+    if not local_only and config.getMQTT():
+        topic, message = _compose(name, level, *message)
+        config.getMQTT().schedulePublish(topic, message, qos=1, timeout=timeout)
 
 
 class Logger:
@@ -2,13 +2,12 @@
 # Copyright Kevin Köck 2018-2020 Released under the MIT license
 # Created on 2018-03-10
 
-__updated__ = "2019-11-02"
-__version__ = "2.6"
+__updated__ = "2026-10-18"
+__version__ = "2.7"
 
 import gc
 from pysmartnode.utils import sys_vars
 from pysmartnode import config
-import uasyncio as asyncio
 
 gc.collect()
 
@@ -26,9 +25,8 @@ class Logging:
             return
         if config.getMQTT() and not local_only:
             message = (b"{} " * len(message)).format(*message)
-            asyncio.create_task(
-                config.getMQTT().publish(self.base_topic.format(level), message, qos=1,
-                                         timeout=timeout, await_connection=True))
+            config.getMQTT().schedulePublish(self.base_topic.format(level), message, qos=1,
+                                             timeout=timeout)
             # format message as bytes so there's no need to encode it later.
 
     def critical(self, *message, local_only=False):
@@ -2,8 +2,8 @@
 # Copyright Kevin Köck 2018-2020 Released under the MIT license
 # Created on 2018-02-17
 
-__updated__ = "2020-08-12"
-__version__ = "6.3"
+__updated__ = "2026-10-18"
+__version__ = "6.16"
 
 import gc
 import ujson
@@ -12,8 +12,10 @@ import uasyncio as asyncio
 import os
 from pysmartnode import config
 from sys import platform
+from micropython import const
 from pysmartnode import logging
 from pysmartnode.utils import sys_vars
+from .subscriptions import SubscriptionTree
 
 if config.MQTT_TYPE:
     from micropython_mqtt_as.mqtt_as_timeout_concurrent import MQTTClient
@@ -26,16 +28,45 @@ gc.collect()
 
 type_gen = type((lambda: (yield))())  # Generator type
 
+# flags of a subscription, stored as last element of the subscription tuple
+_PAYLOAD_TYPE = const(3)  # mask of the payload type the callback expects
+_CHECK_STATE = const(4)  # check retained state topic of the command topic
+_JSON_START = b'{["-0123456789tfn \t\r\n'  # first bytes of a payload that could be json
+_ECHO_TIMEOUT = const(10000)  # ms after publishing until a local publication's echo is expired
+
 
 class MQTTHandler(MQTTClient):
+    # payload types a subscription callback can request, see subscribe()
+    PAYLOAD_JSON = 0
+    PAYLOAD_STR = 1
+    PAYLOAD_BYTES = 2
+
     def __init__(self):
-        self.payload_on = ("ON", True, "True")
-        self.payload_off = ("OFF", False, "False")
+        # str forms of json true/1 and false/0 for subscriptions using PAYLOAD_STR
+        self.payload_on = ("ON", True, "True", "true", "1")
+        self.payload_off = ("OFF", False, "False", "false", "0")
         self.client_id = sys_vars.getDeviceID()
         self.mqtt_home = config.MQTT_HOME
-        self._subs = []
+        self._prefix = "{!s}/{!s}/".format(self.mqtt_home, self.client_id)
+        self._real_topics = {}  # compiled device topics: {device_topic: real_topic}
+        self._topic_refs = {}  # {device_topic: amount of compileTopic calls not released}
+        self._device_topics = {}  # received real topics: {real_topic_bytes: device_topic}
+        # one broker subscription for all device topics, see config.MQTT_DEVICE_WILDCARD
+        self._wildcard = self._prefix + "#" if config.MQTT_DEVICE_WILDCARD else None
+        self._subs = {}  # {topic: [subscriptions]}, one broker subscription per topic
+        self._tree = SubscriptionTree()  # index of _subs for matching received topics
+        self._matches = []  # result list of _tree.match, reused for every received message
+        self._sub_pending = []  # topics that need to be subscribed on the broker
+        self._check_pending = []  # subscriptions that need to check their retained state
         self._sub_task = None
-        self._sub_retained = False
+        self._sub_done = asyncio.Event()  # set while no _sub_task is running
+        self._sub_done.set()
+        self._sub_retained = None  # Event while retained state topics are being checked
+        # device state topics subscribed separately because the wildcard was already active
+        self._local_states = []
+        # [topic, msg, retain, qos, timeout, coalesce, await_connection, echo]
+        self._pub_queue = []
+        self._pub_event = asyncio.Event()
         super().__init__(client_id=self.client_id,
                          server=config.MQTT_HOST,
                          port=config.MQTT_PORT if hasattr(config, "MQTT_PORT") else 1883,
@@ -46,7 +77,7 @@ class MQTTHandler(MQTTClient):
                          wifi_coro=self._wifiChanged,
                          connect_coro=self._connected,
                          will=(
-                             self.getRealTopic(
+                             self.compileTopic(
                                  self.getDeviceTopic(config.MQTT_AVAILABILITY_SUBTOPIC)),
                              "offline", True, 1),
                          clean=False,
@@ -58,13 +89,35 @@ class MQTTHandler(MQTTClient):
         self._reconnected_subs = []
         self._wifi_task = None
         self._wifi_subs = []
-        self.__unsub_tmp = []
         self.__last_disconnect = None  # ticks_ms() of last disconnect
         self.__downtime = 0  # mqtt downtime in seconds
         self.__reconnects = -1  # not counting the first connect
-        self.__dropped = 0  # dropped messages due to MQTT_MAX_CONCURRENT_EXECUTIONS
+        self.__dropped = 0  # dropped messages due to MQTT_CALLBACK_QUEUE_SIZE
+        self.__cb_coalesced = 0  # queued messages replaced by a newer message, see _queueCallback
         self.__timedout = 0  # operations that timed out. doesn't mean it's a problem.
-        self.__active_cbs = 0  # currently active callbacks due to received messages
+        self._cb_queue = []  # [sub, topic, msg, retained] of received messages
+        self._cb_active = []  # subscriptions currently executed by a worker
+        self._cb_event = asyncio.Event()
+        for _ in range(config.MQTT_CALLBACK_WORKERS):
+            asyncio.create_task(self._callbackWorker())
+        self.__pub_dropped = 0  # dropped publications due to MQTT_PUBLISH_QUEUE_SIZE
+        self.__pub_coalesced = 0  # queued publications replaced by a newer message
+        asyncio.create_task(self._publisher())
+        self._store = None  # stores publications while the broker is not reachable
+        self._store_task = None
+        if config.MQTT_STORE_FORWARD_SIZE:
+            from .publication_store import PublicationStore
+            self._store = PublicationStore(config.MQTT_STORE_FORWARD_SIZE)
+        # publications delivered locally and expected to be received from the broker again:
+        # [real topic bytes, msg bytes, ticks_ms() once published or None while publishing]
+        self._echoes = [] if config.MQTT_LOCAL_LOOPBACK else None
+        self._stats = None  # performance counters of topics
+        if config.MQTT_STATS_TOPICS:
+            from .mqtt_stats import TopicStats
+            # discovery messages and logs are published once or to a few topics only
+            self._stats = TopicStats(config.MQTT_STATS_TOPICS, (
+                (config.MQTT_DISCOVERY_PREFIX + "/", "discovery"),
+                ("{!s}/log/".format(config.MQTT_HOME), "log")))
         gc.collect()
 
     def close(self):
@@ -83,11 +136,31 @@ class MQTTHandler(MQTTClient):
     def getDroppedMessages(self):
         return self.__dropped
 
+    def getCoalescedMessages(self):
+        return self.__cb_coalesced
+
+    def getDroppedPublications(self):
+        return self.__pub_dropped
+
+    def getCoalescedPublications(self):
+        return self.__pub_coalesced
+
+    def getTopicStats(self):
+        """Returns the TopicStats object or None if config.MQTT_STATS_TOPICS is 0"""
+        return self._stats
+
+    def getStoredPublications(self):
+        """Returns the bytes used by stored publications waiting to be replayed"""
+        return 0 if self._store is None else len(self._store)
+
     def getTimedOutOperations(self):
         return self.__timedout
 
     def getLenSubscribtions(self):
-        return len(self._subs)
+        """Returns the amount of topics subscribed on the broker"""
+        if self._wildcard is None:
+            return len(self._subs)
+        return len([t for t in self._subs if not self._isLocal(t)]) + 1
 
     def getReconnects(self):
         return self.__reconnects if self.__reconnects > 0 else 0
@@ -172,80 +245,208 @@ class MQTTHandler(MQTTClient):
             if self._sub_task is not None:
                 self._sub_task.cancel()
             self._sub_task = asyncio.create_task(self._subscribeTopics())
+            self._sub_done.clear()
             # TODO: change to asyncio.gather() as soon as cancelling gather works.
             for cb in self._reconnected_subs:
                 res = cb(client)
                 if type(res) == type_gen:
                     await res
+            if self._store is not None and self._store_task is None and len(self._store):
+                self._store_task = asyncio.create_task(self._replayStore())
             self._connected_task = None
         except asyncio.CancelledError:
             if self._sub_task is not None:
                 self._sub_task.cancel()
 
-    async def _subscribeTopics(self, start: int = 0):
-        # TODO: make concurrent for esp32
-        # TODO: if state topic gets unsubscribed in callback and connection breaks,
-        #  command topic won't be subscribed anymore because it is somehow jumped when
-        #  the login topic is subscribed although already unsubscribed...
-        _log.debug("_subscribeTopics, start", start, local_only=True)
+    async def _subscribeTopics(self, resubscribe=True):
+        """
+        Subscribe all pending topics and check the retained states of pending subscriptions.
+        :param resubscribe: subscribe all topics, e.g. after a (re-)connect
+        """
+        _log.debug("_subscribeTopics, resubscribe", resubscribe, local_only=True)
+        if resubscribe:
+            self._sub_pending = list(self._subs)
+            if self._wildcard is not None:
+                self._sub_pending.append(self._wildcard)
+            self._check_pending = [sub for t in self._subs for sub in self._subs[t] if
+                                   sub[3] & _CHECK_STATE]
         if not self.isconnected():
             _log.debug("_subscribeTopics, no connection", local_only=True)
-            return
+            return  # everything gets subscribed after the connect
+        task = self._sub_task  # assigned before this task runs
         try:
-            for i, sub in enumerate(self._subs):
-                # do not iter by range(start,length(_subs)) as _subs could get bigger while itering
-                if i < start:
-                    continue  # iter until start position reached
-                t = sub[0]
-                if self.isDeviceTopic(t):
-                    t = self.getRealTopic(t)
-                if len(sub) == 4:  # requested retained state topic
-                    self._sub_retained = True
-                    # if coro gets canceled in the process, the state topic will be checked
-                    # the next time _subscribeTopic runs after the reconnect
-                    _log.debug("_subscribing", t[:-4], local_only=True)
-                    if not await super().subscribe(t[:-4], 1, await_connection=False):
-                        # state topic
-                        _log.debug("Error subscribing, lost connection:", t[:-4], local_only=True)
+            while self._sub_pending or self._check_pending:
+                # topics subscribed during the process are handled in the next iteration
+                topics = self._sub_pending
+                subs = self._check_pending
+                self._sub_pending = []
+                self._check_pending = []
+                local = self._wildcard is not None
+                if local and self._wildcard in topics:
+                    # (re-)subscribing the wildcard makes the broker send all retained messages
+                    # of device topics, which includes the state topics that need to be checked.
+                    if not await self._sendBatch(True, (self._wildcard,)):
                         return  # connection loss exits the process
-                    ts = time.ticks_ms()  # start timer after successful subscribe otherwise
-                    # it might time out before subscribe has even finished.
-                    while time.ticks_diff(time.ticks_ms(), ts) < 4000 and self._sub_retained:
-                        # wait 4 seconds for answer
-                        # TODO: split this into a different task so it doesn't delay subscribing.
-                        await asyncio.sleep_ms(100)
-                    if self._sub_retained is True:  # no state message received
-                        self._subs[i] = sub[:3]
-                        self._sub_retained = False
-                        _log.debug("Unsubscribing state topic", t[:-4], "in _subsscribeTopics",
-                                   local_only=True)
-                        if not await super().unsubscribe(t[:-4], await_connection=False):
-                            _log.debug("Error unsubscribing state topic, lost conenction:", t[:-4],
-                                       local_only=True)
-                            return  # connection loss exits the process
-                _log.debug("_subscribing", t, local_only=True)
-                if not await super().subscribe(t, 1, await_connection=False):
-                    _log.debug("Error subscribing, lost connection:", t, local_only=True)
+                    topics = [t for t in topics if t != self._wildcard]
+                    local = False
+                # if coro gets canceled in the process, the state topics will be checked
+                # the next time _subscribeTopic runs after the reconnect
+                if not await self._checkRetainedStates(subs, local):
+                    _log.debug("Error checking retained states, lost connection", local_only=True)
+                    return  # connection loss exits the process
+                _log.debug("_subscribing", len(topics), "topics", local_only=True)
+                # topics could have been unsubscribed in the meantime
+                if not await self._sendBatch(True, (self.getRealTopic(t) for t in topics if
+                                                    t in self._subs and not self._isLocal(t))):
+                    _log.debug("Error subscribing, lost connection", local_only=True)
                     return  # connection loss exits the process
                 # no timeouts because _subscribeTopics will get canceled when connection is lost
         except asyncio.CancelledError:
             _log.debug("_subscribeTopics cancelled", local_only=True)
         finally:
-            # remove pending unsubscribe requests
-            for sub in self.__unsub_tmp:
-                self._subs.remove(sub)
-                self.__unsub_tmp = []
-            self._sub_task = None
+            if self._sub_task is task:  # a cancelled task must not reset a newer task
+                self._sub_task = None
+                self._sub_done.set()  # wake up awaitSubscriptionsDone
             _log.debug("_subscribeTopics exited", local_only=True)
 
+    async def _checkRetainedStates(self, subs, local=False):
+        """
+        Subscribe the state topics of all subscriptions that requested their retained state
+        and wait for the retained messages with one shared timeout.
+        State topics that didn't receive a retained message get unsubscribed.
+        :param local: subscribe state topics of device topics too because the device wildcard
+        is already active. Subscribing the wildcard again would make the broker send all
+        retained messages of the device.
+        :return: False on connection loss
+        """
+        subs = [sub for sub in subs if self._isSubscribed(sub)]
+        if not subs:
+            return True
+        if local:
+            for sub in subs:
+                tp = sub[0][:-4]
+                if self._isLocal(tp) and tp not in self._local_states:
+                    self._local_states.append(tp)
+        ev = self._sub_retained = asyncio.Event()
+        try:
+            if not await self._sendBatch(True, self._stateTopics(subs)):
+                return False
+            ts = time.ticks_ms()  # start timer after successful subscribe otherwise
+            # it might time out before subscribe has even finished.
+            while True:
+                # subscriptions are replaced once their retained state has been received
+                subs = [sub for sub in subs if self._isSubscribed(sub)]
+                sl = 4000 - time.ticks_diff(time.ticks_ms(), ts)
+                if not subs or sl <= 0:
+                    break
+                ev.clear()
+                try:
+                    await asyncio.wait_for_ms(ev.wait(), sl)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if self._sub_retained is ev:  # a cancelled task must not reset a newer Event
+                self._sub_retained = None
+        for sub in subs:  # no state message received
+            self._removeStateSubscription(sub)
+        _log.debug("Unsubscribing", len(subs), "state topics in _checkRetainedStates",
+                   local_only=True)
+        return await self._sendBatch(False, self._stateTopics(subs, True))
+
+    def _stateTopics(self, subs, release=False):
+        # real state topics of subs that are not subscribed as a normal topic anyway.
+        # Device topics are received by the wildcard unless subscribed separately.
+        # release: the state topics get unsubscribed, remove them from _local_states
+        t = []
+        for sub in subs:
+            tp = sub[0][:-4]
+            if tp not in self._subs and tp not in t and (
+                    not self._isLocal(tp) or tp in self._local_states):
+                t.append(tp)
+                if release and tp in self._local_states:
+                    self._local_states.remove(tp)
+        return [self.getRealTopic(tp) for tp in t]
+
+    def _isLocal(self, topic):
+        # device topics are received by the wildcard subscription and only dispatched locally
+        return self._wildcard is not None and topic.startswith("./")
+
+    def _isSubscribed(self, sub):
+        subs = self._subs.get(sub[0])
+        return subs is not None and sub in subs
+
+    async def _sendBatch(self, subscribe, topics):
+        """
+        Send the (un-)subscribe requests of all topics without waiting for each acknowledgement
+        before sending the next request. The acknowledgements are awaited once the combined
+        length of the pending topics reaches config.MQTT_SUBSCRIBE_BATCH_SIZE.
+        :param subscribe: True for subscribing, False for unsubscribing
+        :param topics: iterable of real topics
+        :return: True if all requests were acknowledged, False on connection loss
+        """
+        tasks = []
+        size = 0
+        res = True
+        try:
+            for t in topics:
+                if tasks and size + len(t) > config.MQTT_SUBSCRIBE_BATCH_SIZE:
+                    for task in tasks:
+                        if not await task:
+                            res = False
+                    tasks = []
+                    size = 0
+                    if not res:
+                        return False
+                if subscribe:
+                    coro = super().subscribe(t, 1, await_connection=False)
+                else:
+                    coro = super().unsubscribe(t, await_connection=False)
+                tasks.append(asyncio.create_task(coro))
+                size += len(t)
+            for task in tasks:
+                if not await task:
+                    res = False
+            return res
+        finally:
+            for task in tasks:
+                task.cancel()  # no effect on finished tasks
+
+    def _addSubscription(self, sub):
+        """
+        Add subscription to the fan-out list of its topic.
+        :return: True if the topic is new and has to be subscribed on the broker
+        """
+        subs = self._subs.get(sub[0])
+        if subs is None:
+            self.compileTopic(sub[0])
+            self._subs[sub[0]] = [sub]
+        else:
+            subs.append(sub)
+        self._tree.add(sub[0], sub)
+        if sub[3] & _CHECK_STATE:
+            self.compileTopic(sub[0][:-4])
+            self._tree.add(sub[0][:-4], sub, state_topic=True)
+        return subs is None
+
+    def _removeStateSubscription(self, sub):
+        """Replace a subscription checking its retained state topic by a normal one"""
+        if not self._isSubscribed(sub):
+            return  # already replaced or unsubscribed
+        nsub = (sub[0], sub[1], sub[2], sub[3] & ~_CHECK_STATE)
+        subs = self._subs[sub[0]]
+        subs[subs.index(sub)] = nsub
+        self._tree.remove(sub[0], sub)
+        self._tree.remove(sub[0][:-4], sub, state_topic=True)
+        self._tree.add(nsub[0], nsub)
+        self._releaseTopic(sub[0][:-4])  # compiled in _addSubscription
+
     def _convertToDeviceTopic(self, topic):
-        t = topic.replace("{!s}/{!s}/".format(self.mqtt_home, self.client_id), "./")
-        if t == topic:  # nothing replaced
+        if not topic.startswith(self._prefix):
             raise TypeError("Topic is not a device subscription: {!s}".format(topic))
-        return t
+        return "./" + topic[len(self._prefix):]
 
     def _isDeviceSubscription(self, topic):
-        return topic.startswith("{!s}/{!s}/".format(self.mqtt_home, self.client_id))
+        return topic.startswith(self._prefix)
 
     # @micropython.native native emitter on esp8266 not working anymore and not working on pyboard
     @staticmethod
@@ -306,46 +507,44 @@ class MQTTHandler(MQTTClient):
         if topic is not None and self._isDeviceSubscription(topic):
             topic = self._convertToDeviceTopic(topic)
         _log.debug("unsubscribing topic", topic, "from component", component, local_only=True)
-        r = self.__unsub_tmp
-        t = []
-        for sub in self._subs:
-            if topic is None and sub[2] == component:
-                if sub not in r:  # already unsubscribed but _subscribeTopics still active
-                    r.append(sub)
-                    if sub[0] not in t:
-                        t.append(sub[0])
-            elif sub[0] == topic and (component is None or component == sub[2]):
-                if sub not in r:  # already unsubscribed but _subscribeTopics still active
-                    r.append(sub)
-                    if sub[0] not in t:
-                        t.append(sub[0])
-        if not r:
+        found = False
+        t = []  # topics without subscriptions left
+        st = []  # subscriptions still checking their retained state
+        for tp in (list(self._subs) if topic is None else (topic,) if topic in self._subs else ()):
+            subs = self._subs[tp]
+            for sub in [sub for sub in subs if component is None or sub[2] == component]:
+                subs.remove(sub)  # no more callbacks, fan-out lists are short
+                found = True
+                if self._tree.remove(sub[0], sub) and sub[3] & _CHECK_STATE:
+                    self._tree.remove(sub[0][:-4], sub, state_topic=True)
+                    st.append(sub)
+            if not subs:
+                del self._subs[tp]
+                t.append(tp)
+        if not found:
             if topic:  # only log if a topic was requested, could be a component removal
                 _log.error("Can't unsubscribe, topic not found:", topic, "component", component,
                            local_only=True)
             return False
-        s = True
-        for sub in t:
-            _log.debug("Unsubscribing from broker:", sub, local_only=True)
-            if not await super().unsubscribe(self.getRealTopic(sub), await_connection=False):
-                _log.error("Error unsubscribing, lost conenction:", sub, local_only=True)
-                s = False
-        del t
-        # unsubscribe from broker but locally have to wait for subscribe to be finished
-        # so the subs list doesn't get messed up. _sub_task will remove values on finish.
-        if self._sub_task:
-            return s
-        # remove pending unsubscribe requests
-        for sub in r:
-            try:
-                self._subs.remove(sub)
-            except ValueError:
-                pass  # already removed by different unsubscribe attempt
-        self.__unsub_tmp = []
+        for tp in t:
+            self._releaseTopic(tp)
+            if self._stats is not None:
+                self._stats.remove(tp)
+        for sub in st:
+            self._releaseTopic(sub[0][:-4])  # state topic compiled in _addSubscription
+        # only topics without subscriptions left are unsubscribed on the broker
+        t = [self.getRealTopic(tp) for tp in t if not self._isLocal(tp)]
+        t += self._stateTopics(st, True)
+        if not t:
+            return True
+        _log.debug("Unsubscribing from broker:", t, local_only=True)
+        s = await self._sendBatch(False, t)
+        if not s:
+            _log.error("Error unsubscribing, lost conenction:", t, local_only=True)
         return s
 
     async def subscribe(self, topic, cb, component=None, qos=1, check_retained_state=False,
-                        timeout=None, await_connection=True):
+                        timeout=None, await_connection=True, payload_type=PAYLOAD_JSON):
         """
         Subscribe a topic
         :param topic: str, either real topic or deviceTopic
@@ -355,38 +554,60 @@ class MQTTHandler(MQTTClient):
         :param check_retained_state: check the retained state of the state topic of a subscription
         :param timeout: returns after timeout without knowing the succes. Will subscribe anyway.
         :param await_connection: Return if no connection. Will subscribe anyway
+        :param payload_type: type of the payload the callback expects:
+        PAYLOAD_JSON: json decoded object if payload is valid json, otherwise str (default)
+        PAYLOAD_STR: str, saves the attempt to decode json
+        PAYLOAD_BYTES: received bytes object, saves decoding the payload at all
+        The payload is only decoded once for all matching subscriptions and only if requested.
         :return: True if subscription is acknowledged, else False (but will subscribe anyway)
         """
-        self.subscribeSync(topic, cb, component, qos, check_retained_state)
-        return self.awaitSubscriptionsDone(timeout, await_connection)
+        self.subscribeSync(topic, cb, component, qos, check_retained_state, payload_type)
+        return await self.awaitSubscriptionsDone(timeout, await_connection)
 
-    def subscribeSync(self, topic, cb, component=None, qos=1, check_retained_state=False):
+    def subscribeSync(self, topic, cb, component=None, qos=1, check_retained_state=False,
+                      payload_type=PAYLOAD_JSON):
         _log.debug("Subscribing to topic", topic, "for component", component, "checking retained",
                    check_retained_state, local_only=True)
         if self._isDeviceSubscription(topic):
             topic = self._convertToDeviceTopic(topic)
         if check_retained_state and topic.endswith("/set"):
-            sub = (topic, cb, component, True)
-        else:  # if no command_topic then ignore check_retained_state
-            sub = (topic, cb, component)
-        self._subs.append(sub)
+            payload_type |= _CHECK_STATE
+        # if no command_topic then ignore check_retained_state
+        sub = (topic, cb, component, payload_type)
+        if self._addSubscription(sub) and not self._isLocal(topic):
+            self._sub_pending.append(topic)
+        elif not payload_type & _CHECK_STATE:
+            return  # topic already subscribed on the broker or received by the wildcard
+        if payload_type & _CHECK_STATE:
+            self._check_pending.append(sub)
         if self._sub_task is None:
-            self._sub_task = asyncio.create_task(self._subscribeTopics(self._subs.index(sub)))
+            self._sub_task = asyncio.create_task(self._subscribeTopics(False))
+            self._sub_done.clear()
 
     async def awaitSubscriptionsDone(self, timeout=None, await_connection=True):
         start = time.ticks_ms()
-        while timeout is None or time.ticks_diff(time.ticks_ms(), start) < timeout * 1000:
+        while True:
             if not await_connection and not self._isconnected:
                 return False
             if self._sub_task is None:
                 return True  # all topics subscribed.
-            await asyncio.sleep_ms(50)  # can't await task directly because if this task gets
-            # cancelled, it will cancel the subscription task.. Could use an Event though.
-        return False  # timeout
+            # can't await task directly because if this task gets cancelled,
+            # it will cancel the subscription task.
+            if timeout is None:
+                await self._sub_done.wait()
+            else:
+                t = int(timeout * 1000) - time.ticks_diff(time.ticks_ms(), start)
+                if t <= 0:
+                    return False  # timeout
+                try:
+                    await asyncio.wait_for_ms(self._sub_done.wait(), t)
+                except asyncio.TimeoutError:
+                    return False
+            # a new _sub_task could have been started since the event was set
 
     @staticmethod
     def getDeviceTopic(attrib, is_request=False):
-        return "./{}{}".format(attrib, "/set" if is_request else "")
+        return "./" + attrib + "/set" if is_request else "./" + attrib
 
     @staticmethod
     def isDeviceTopic(topic):
@@ -395,7 +616,40 @@ class MQTTHandler(MQTTClient):
     def getRealTopic(self, device_topic):
         if not device_topic.startswith("./"):
             return device_topic  # no need to raise an error if real topic is passed
-        return "{}/{}/{}".format(self.mqtt_home, self.client_id, device_topic[2:])
+        t = self._real_topics.get(device_topic)
+        return self._prefix + device_topic[2:] if t is None else t
+
+    def compileTopic(self, topic):
+        """
+        Resolve a device topic once so publishing to it and receiving it doesn't need to
+        build the real topic again. Use it for topics that are used repeatedly.
+        Compiled topics are reference counted, subscriptions release theirs when unsubscribed.
+        :param topic: device topic or real topic
+        :return: real topic
+        """
+        if not topic.startswith("./"):
+            return topic
+        t = self._real_topics.get(topic)
+        if t is None:
+            t = self._real_topics[topic] = self._prefix + topic[2:]
+            if "+" not in t and "#" not in t:  # wildcards are never received
+                self._device_topics[t.encode()] = topic
+            self._topic_refs[topic] = 1
+        else:
+            self._topic_refs[topic] += 1
+        return t
+
+    def _releaseTopic(self, topic):
+        # remove a compiled topic once nobody that compiled it uses it anymore
+        n = self._topic_refs.get(topic)
+        if n is None:
+            return
+        if n > 1:
+            self._topic_refs[topic] = n - 1
+            return
+        del self._topic_refs[topic]
+        t = self._real_topics.pop(topic)
+        self._device_topics.pop(t.encode(), None)
 
     def _execute_sync(self, topic, msg, retained):
         _log.debug("mqtt received:", topic, msg, retained, local_only=True)
@@ -409,55 +663,176 @@ class MQTTHandler(MQTTClient):
                        local_only=True)
             return
         """
-        topic = topic.decode()
-        msg = msg.decode()
-        try:
-            msg = ujson.loads(msg)
-        except ValueError:
-            pass  # maybe not a json string, no way of knowing
-        if self._isDeviceSubscription(topic):
-            topic = self._convertToDeviceTopic(topic)
-        found = False
-        for sub in self._subs:
-            if self.matchesSubscription(topic, sub[0], ignore_command=len(sub) == 4):
-                if config.MQTT_MAX_CONCURRENT_EXECUTIONS != -1:
-                    dr = self.__active_cbs >= config.MQTT_MAX_CONCURRENT_EXECUTIONS
+        if self._echoes and not retained:
+            echoes = self._echoes
+            i = 0
+            while i < len(echoes):
+                e = echoes[i]
+                if e[0] == topic and e[1] == msg:
+                    del echoes[i]
+                    return  # already delivered locally when it was published
+                if e[2] is not None and time.ticks_diff(time.ticks_ms(), e[2]) > _ECHO_TIMEOUT:
+                    del echoes[i]  # echo lost, e.g. the subscription was removed
                 else:
-                    dr = 0
-                if dr:
-                    self.__dropped += 1
-                    _log.error("dropping message of topic", topic, "component", sub[2],
-                               "too many active cbss:", "{!s}".format(self.__active_cbs),
-                               local_only=True)
+                    i += 1
+        self._dispatch(topic, msg, retained)
+
+    def _dispatch(self, topic, msg, retained, received=True):
+        """
+        Queue the callbacks of all subscriptions matching the topic.
+        :param topic: real topic as bytes
+        :param msg: bytes
+        :param retained: bool
+        :param received: if the message was received from the broker
+        :return: True if a subscription matched
+        """
+        t = self._device_topics.get(topic)
+        if t is None:
+            topic = topic.decode()
+            if self._isDeviceSubscription(topic):
+                topic = self._convertToDeviceTopic(topic)
+        else:
+            topic = t
+        found = False
+        msg_str = None
+        msg_json = None
+        matches = self._tree.match(topic, self._matches)
+        try:
+            for sub in matches:
+                # payload only decoded if requested by a subscription and only once.
+                tp = sub[3] & _PAYLOAD_TYPE
+                if tp == self.PAYLOAD_BYTES:
+                    payload = msg
                 else:
-                    self.__active_cbs += 1
-                    asyncio.create_task(self._execute_callback(sub, topic, msg, retained))
+                    if msg_str is None:
+                        msg_str = msg.decode()
+                    payload = msg_str
+                    if tp == self.PAYLOAD_JSON:
+                        if msg_json is None:
+                            msg_json = msg_str
+                            if msg and msg[0] in _JSON_START:
+                                # no exception for payloads that can't be json like "ON"
+                                try:
+                                    msg_json = ujson.loads(msg_str)
+                                except ValueError:
+                                    pass  # maybe not a json string, no way of knowing
+                        payload = msg_json
+                if self._stats is not None:
+                    self._stats.received(sub[0], len(msg))
+                self._queueCallback(sub, topic, payload, retained)
                 found = True
-        if found is False:
+        finally:
+            matches.clear()  # reused for the next message, no references to old subscriptions
+        if found is False and received and not self._isLocal(topic):
+            # wildcard receives all device topics
             _log.warn("Subscribed topic", topic,
                       "not found, should solve itself. not yet unsubscribed", local_only=True)
+        return found
+
+    def _deliverLocal(self, topic, msg):
+        """
+        Deliver a publication to matching subscriptions of this device without waiting
+        for the broker. Like for existing subscriptions on a broker, the message is not
+        received as retained message.
+        :param topic: real topic
+        :param msg: bytes or bytearray
+        :return: True if a subscription matched and the broker will send the message back
+        once it is published, see _publish.
+        """
+        if type(msg) == bytearray:  # composed messages, bytearray can't be decoded on all ports
+            msg = bytes(msg)
+        return self._dispatch(topic.encode(), msg, False, False)
+
+    def _addEcho(self, topic, msg):
+        # expect the publication to be received from the broker again, see _execute_sync
+        e = [topic.encode(), bytes(msg) if type(msg) == bytearray else msg, None]
+        self._echoes.append(e)
+        if len(self._echoes) > config.MQTT_CALLBACK_QUEUE_SIZE:
+            del self._echoes[0]  # oldest echo probably lost
+        return e
+
+    def _removeEcho(self, e):
+        for i, echo in enumerate(self._echoes):
+            if echo is e:
+                del self._echoes[i]
+                return
+
+    def _queueCallback(self, sub, topic, msg, retained):
+        q = self._cb_queue
+        if len(q) >= config.MQTT_CALLBACK_QUEUE_SIZE:
+            mode = config.MQTT_CALLBACK_OVERFLOW
+            if mode == 2:  # replace an older message of the same subscription and topic
+                for i, item in enumerate(q):
+                    if item[0] is sub and item[1] == topic:
+                        del q[i]  # newest message appended, keeping the order of messages
+                        self.__cb_coalesced += 1
+                        break
+                else:  # never drop messages of other subscriptions, e.g. commands of a switch
+                    mode = 1
+            if mode != 2:
+                self.__dropped += 1
+                if mode == 1:  # drop newest
+                    _log.error("Callback queue full, dropping message of topic", topic,
+                               local_only=True)
+                    return
+                _log.error("Callback queue full, dropping message of topic", q[0][1],
+                           local_only=True)
+                del q[0]  # drop oldest
+        q.append([sub, topic, msg, retained])
+        self._cb_event.set()
+
+    async def _callbackWorker(self):
+        q = self._cb_queue
+        active = self._cb_active
+        while True:
+            item = None
+            for i, it in enumerate(q):
+                # messages of one subscription are executed in order and never concurrently
+                for sub in active:
+                    if sub is it[0]:
+                        break
+                else:
+                    item = q.pop(i)
+                    break
+            if item is None:
+                self._cb_event.clear()
+                await self._cb_event.wait()
+                continue
+            active.append(item[0])
+            try:
+                await self._execute_callback(item[0], item[1], item[2], item[3])
+            except Exception as e:
+                _log.error("Error in callback worker:", e, local_only=True)
+            finally:
+                for i, sub in enumerate(active):
+                    if sub is item[0]:  # by identity, equal subscriptions could be active
+                        del active[i]
+                        break
+                if q:
+                    self._cb_event.set()  # queued messages of this subscription can be executed
 
     async def _execute_callback(self, sub, topic, msg, retained):
         _log.debug("execute_callback of", sub[2], ":", topic,
                    msg if type(msg) in (str, int, float) else type(msg), local_only=True)
-        if len(sub) == 4 and "/+" not in sub[0]:  # sub can't end with /#/set but /+/set
+        if sub[3] & _CHECK_STATE and "/+" not in sub[0]:  # sub can't end with /#/set but /+/set
             # retained state topic received without wildcards (could receive multiple states)
-            self._subs[self._subs.index(sub)] = sub[:3]
-            self._sub_retained = False
-            if self.isDeviceTopic(sub[0]):
-                t = self.getRealTopic(sub[0])[:-4]
+            self._removeStateSubscription(sub)
+            if self._sub_retained is not None:
+                self._sub_retained.set()  # wake up _checkRetainedStates
+            for s in self._subs.get(sub[0], ()):
+                if s[3] & _CHECK_STATE:
+                    break  # state topic still needed by another subscription
             else:
-                t = sub[0][:-4]
-            _log.debug("Unsubscribing state topic", t, "in _exec_cb", local_only=True)
-            if not await super().unsubscribe(t, await_connection=False):
-                _log.error("Error unsubscribing state topic, lost conenction:", t, local_only=True)
-            del t
+                for t in self._stateTopics((sub,), True):  # not if subscribed as normal topic
+                    _log.debug("Unsubscribing state topic", t, "in _exec_cb", local_only=True)
+                    if not await super().unsubscribe(t, await_connection=False):
+                        _log.error("Error unsubscribing state topic, lost conenction:", t,
+                                   local_only=True)
             gc.collect()
             # unsubscribing before executing to prevent callback to publish to state topic
             if not retained:
                 _log.error("Received non retained message when checking retained state topic",
                            topic, ",ignoring message", local_only=True)
-                self.__active_cbs -= 1
                 return
         _t1 = time.ticks_ms()
         res = None
@@ -470,14 +845,15 @@ class MQTTHandler(MQTTClient):
                 if res:  # Could be any return value
                     if res is True:
                         res = msg  # send original msg back if return is True
-                    await self.publish(topic[:-4], res, qos=1, retain=True)
+                    self.schedulePublish(topic[:-4], res, qos=1, retain=True)
+                    # queued so the worker isn't blocked by the publication
         except Exception as e:
-            await _log.asyncLog("error",
-                                "Error executing {!s}mqtt topic {!r}: {!s}".format(
-                                    "retained " if retained else "", topic, e))
+            _log.error("Error executing {!s}mqtt topic {!r}: {!s}".format(
+                "retained " if retained else "", topic, e))
         finally:
-            self.__active_cbs -= 1
             _t2 = time.ticks_ms()
+            if self._stats is not None:
+                self._stats.executed(sub[0], time.ticks_diff(_t2, _t1))
             _log.debug("execute_callback of", sub[2], ":", topic,
                        msg if type(msg) in (str, int, float) else type(msg),
                        "took {!s}ms".format(time.ticks_diff(_t2, _t1)), "returned", res,
@@ -499,25 +875,142 @@ class MQTTHandler(MQTTClient):
         because False already represents timeout error and the difference between connection loss
         and timeout shouldn't matter.
         """
+        msg = self._encodeMessage(msg)
+        topic = self.getRealTopic(topic)
+        echo = self._echoes is not None and self._deliverLocal(topic, msg)
+        return await self._publish(topic, msg, retain, qos, timeout, await_connection, echo)
+
+    async def _publish(self, topic, msg, retain, qos, timeout, await_connection, echo=False):
+        # publish encoded message to real topic on the broker
+        # echo: message was delivered locally, the broker will send it back
         if (not await_connection and not self.isconnected()) or timeout == 0:
             return False
-        if type(msg) == dict or type(msg) == list:
-            msg = ujson.dumps(msg)
-        elif type(msg) not in (str, bytes):
-            msg = str(msg).encode()
-        if self.isDeviceTopic(topic):
-            topic = self.getRealTopic(topic)
-        msg = msg.encode() if type(msg) == str else msg
-        # note that msg has to be bytes otherwise mqtt library produces errors when sending
         gc.collect()
+        res = False
+        t = time.ticks_ms()
+        # registered before sending because the broker could send it back before the puback
+        e = self._addEcho(topic, msg) if echo else None
         try:
-            return await super().publish(topic, msg, retain, qos, timeout=timeout,
-                                         await_connection=await_connection)
+            res = await super().publish(topic, msg, retain, qos, timeout=timeout,
+                                        await_connection=await_connection)
+            return res
         except asyncio.TimeoutError:
             self.__timedout += 1
             return False
+        finally:
+            if e is not None:
+                if res:
+                    e[2] = time.ticks_ms()  # expires if not received from the broker
+                else:
+                    self._removeEcho(e)  # not sent, don't ignore the next identical message
+            if self._stats is not None:
+                if self._isDeviceSubscription(topic):  # same key as subscriptions
+                    topic = self._convertToDeviceTopic(topic)
+                self._stats.published(topic, len(msg), time.ticks_diff(time.ticks_ms(), t), res)
+
+    @staticmethod
+    def _encodeMessage(msg):
+        if type(msg) == dict or type(msg) == list:
+            msg = ujson.dumps(msg)
+        elif type(msg) not in (str, bytes, bytearray):  # bytearray e.g. from composer
+            msg = str(msg).encode()
+        return msg.encode() if type(msg) == str else msg
+        # note that msg has to be bytes otherwise mqtt library produces errors when sending
 
     def schedulePublish(self, topic, msg, retain=False, qos=0, timeout=None,
-                        await_connection=True) -> asyncio.Task:
-        return asyncio.create_task(
-            self.publish(topic, msg, retain, qos, timeout, await_connection))
+                        await_connection=True, coalesce=None, store=False) -> bool:
+        """
+        Put a message into the publish queue, which is processed by a single task.
+        Use this instead of creating a new task for each publication. The amount of queued
+        messages is limited by config.MQTT_PUBLISH_QUEUE_SIZE.
+        :param topic: str
+        :param msg: json convertable object
+        :param retain: bool
+        :param qos: 0 or 1
+        :param timeout: seconds, timeout of the publication once the message is being published.
+        :param await_connection: if False the message will be dropped if there is no connection
+        when it is queued or when it is being published.
+        :param coalesce: if True a queued message of the same topic will be replaced by this one.
+        Defaults to True for retained messages as only the newest state is relevant.
+        :param store: if True and config.MQTT_STORE_FORWARD_SIZE is set, the message will be
+        stored in flash while there is no connection and published with its timestamp once the
+        connection is back, see _replayStore.
+        :return: True if message was queued or stored, False if it was dropped.
+        """
+        topic = self.getRealTopic(topic)
+        msg = self._encodeMessage(msg)
+        echo = self._echoes is not None and self._deliverLocal(topic, msg)
+        if store and self._store is not None and not self.isconnected():
+            return self._store.append(topic.encode(), msg, int(time.time()))
+        if (not await_connection and not self.isconnected()) or timeout == 0:
+            return False
+        coalesce = retain if coalesce is None else coalesce
+        q = self._pub_queue
+        if coalesce:
+            for pub in q:
+                if pub[5] and pub[0] == topic:  # newest message wins
+                    pub[1] = msg
+                    pub[2] = retain
+                    pub[3] = qos
+                    pub[4] = timeout
+                    pub[6] = await_connection
+                    pub[7] = echo
+                    self.__pub_coalesced += 1
+                    return True
+        if len(q) >= config.MQTT_PUBLISH_QUEUE_SIZE:
+            self.__pub_dropped += 1
+            for i, pub in enumerate(q):
+                if not pub[2]:  # drop oldest message that is not retained
+                    del q[i]
+                    break
+            else:
+                _log.error("Publish queue full, dropping message of topic", topic,
+                           local_only=True)
+                return False
+        q.append([topic, msg, retain, qos, timeout, coalesce, await_connection, echo])
+        self._pub_event.set()
+        return True
+
+    async def _publisher(self):
+        q = self._pub_queue
+        while True:
+            while not q:
+                self._pub_event.clear()
+                await self._pub_event.wait()
+            topic, msg, retain, qos, timeout, _, await_connection, echo = q.pop(0)
+            try:
+                await self._publish(topic, msg, retain, qos, timeout, await_connection, echo)
+            except Exception as e:
+                _log.error("Error publishing queued message of topic", topic, e, local_only=True)
+
+    async def _replayStore(self):
+        """
+        Publish all stored publications with a pause of config.MQTT_STORE_FORWARD_INTERVAL
+        between messages to not flood the broker or the publish queue.
+        Stored messages are published to <topic>/stored as {"ts": "<time>", "value": <msg>}
+        so consumers of <topic> don't receive old values as current state.
+        A message is only removed from the store once it has been published.
+        """
+        s = self._store
+        try:
+            while self.isconnected():
+                rec = s.peek()
+                if rec is None:
+                    return
+                topic, msg, ts = rec
+                try:
+                    value = ujson.loads(msg)
+                except ValueError:
+                    value = msg.decode()
+                t = time.localtime(ts)
+                msg = ujson.dumps({"ts": "{}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(
+                    t[0], t[1], t[2], t[3], t[4], t[5]), "value": value})
+                if not await self.publish(topic.decode() + "/stored", msg, qos=1, timeout=10,
+                                          await_connection=False):
+                    return  # replay continues after the next reconnect
+                s.pop()
+                await asyncio.sleep_ms(config.MQTT_STORE_FORWARD_INTERVAL)
+        except Exception as e:
+            _log.error("Error replaying stored publications:", e, local_only=True)
+        finally:
+            self._store_task = None
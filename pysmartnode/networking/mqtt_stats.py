@@ -0,0 +1,123 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2020 Released under the MIT license
+# Created on 2026-10-18
+
+__updated__ = "2026-10-18"
+__version__ = "0.2"
+
+# Performance counters of MQTT subscriptions and publish topics using a fixed amount of memory.
+# Each topic has an array with the counters and two latency histograms with log-scaled buckets
+# (factor 4) in ms: 0, <4, <16, <64, <256, <1024, >=1024.
+# Once the maximum amount of topics is reached, all other topics are counted as "other".
+# Publications of topics starting with a group prefix (e.g. discovery and log topics) are
+# counted together in the counters of the group, so one-shot topics don't take a slot.
+
+from array import array
+from micropython import const
+
+_BUCKETS = const(7)
+_iIN = const(0)  # received messages
+_iIN_BYTES = const(1)
+_iOUT = const(2)  # published messages
+_iOUT_BYTES = const(3)
+_iTIMEOUTS = const(4)  # failed publications
+_iCB_HIST = const(5)  # histogram of callback durations
+_iPUB_HIST = const(12)  # histogram of publish durations, _iCB_HIST + _BUCKETS
+_SIZE = const(19)  # _iPUB_HIST + _BUCKETS
+
+BUCKETS = ("0", "<4", "<16", "<64", "<256", "<1024", ">=1024")
+
+
+def _bucket(ms):
+    i = 0
+    while ms > 0 and i < _BUCKETS - 1:
+        ms >>= 2
+        i += 1
+    return i
+
+
+class TopicStats:
+    def __init__(self, max_topics, groups=()):
+        """
+        :param max_topics: maximum amount of topics with separate counters
+        :param groups: tuple of (prefix, name) of publish topics counted together as name.
+        Groups are not limited by max_topics.
+        """
+        self._max = max_topics
+        self._groups = groups
+        self._topics = {}
+        self._count = 0  # topics counting against max_topics
+
+    def _get(self, topic, limit=True):
+        c = self._topics.get(topic)
+        if c is None:
+            if limit:
+                if self._count >= self._max:
+                    topic = "other"
+                    c = self._topics.get(topic)
+                else:
+                    self._count += 1
+            if c is None:
+                c = self._topics[topic] = array("I", bytes(4 * _SIZE))
+        return c
+
+    def received(self, topic, size):
+        """
+        :param topic: subscription topic
+        :param size: payload length in bytes
+        """
+        c = self._get(topic)
+        c[_iIN] += 1
+        c[_iIN_BYTES] += size
+
+    def executed(self, topic, ms):
+        """
+        :param topic: subscription topic
+        :param ms: duration of the callback
+        """
+        self._get(topic)[_iCB_HIST + _bucket(ms)] += 1
+
+    def published(self, topic, size, ms, success):
+        """
+        :param topic: publish topic, device topics in the form "./x" like subscriptions
+        :param size: payload length in bytes
+        :param ms: duration of the publication
+        :param success: False if publication timed out or failed
+        """
+        for prefix, name in self._groups:
+            if topic.startswith(prefix):
+                c = self._get(name, False)
+                break
+        else:
+            c = self._get(topic)
+        c[_iOUT] += 1
+        c[_iOUT_BYTES] += size
+        c[_iPUB_HIST + _bucket(ms)] += 1
+        if not success:
+            c[_iTIMEOUTS] += 1
+
+    def remove(self, topic):
+        """Remove counters of a topic, e.g. once it has been unsubscribed"""
+        if self._topics.pop(topic, None) is not None and topic != "other":
+            self._count -= 1
+
+    def report(self):
+        """
+        Returns a dict of all counters that can be converted to json.
+        Histograms only contain the counts, the bucket names are in BUCKETS.
+        """
+        r = {}
+        for topic in self._topics:
+            c = self._topics[topic]
+            d = {}
+            if c[_iIN]:
+                d["in"] = c[_iIN]
+                d["in_bytes"] = c[_iIN_BYTES]
+                d["cb_ms"] = list(c[_iCB_HIST:_iCB_HIST + _BUCKETS])
+            if c[_iOUT]:
+                d["out"] = c[_iOUT]
+                d["out_bytes"] = c[_iOUT_BYTES]
+                d["failed"] = c[_iTIMEOUTS]
+                d["pub_ms"] = list(c[_iPUB_HIST:_SIZE])
+            r[topic] = d
+        return r
@@ -0,0 +1,151 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2020 Released under the MIT license
+# Created on 2026-10-18
+
+__updated__ = "2026-10-18"
+__version__ = "0.1"
+
+# Ring buffer in a file of fixed size storing publications while the broker is not reachable
+# so they can be published once the connection is back. Nothing is held in RAM.
+# File layout: header with read position, write position and used bytes of the data region,
+# followed by the data region containing records:
+# <topic length 2B><message length 2B><timestamp 4B><topic><message>
+# A record with topic length 0 or less than a header of space left marks the end of the data
+# region, the next record starts at the beginning of the data region.
+# If the buffer is full, the oldest records get overwritten.
+
+import os
+import struct
+from micropython import const
+
+_FILE_HEADER = "<III"
+_FILE_HEADER_SIZE = const(12)
+_RECORD_HEADER = "<HHI"
+_RECORD_HEADER_SIZE = const(8)
+
+
+class PublicationStore:
+    def __init__(self, size, file="publications.bin"):
+        """
+        :param size: size of the file in bytes
+        :param file: filename
+        """
+        self._file = file
+        self._size = size - _FILE_HEADER_SIZE  # size of data region
+        self._r = 0  # read position in data region
+        self._w = 0  # write position in data region
+        self._used = 0  # bytes of data region used by records and skipped space at the end
+        self._dropped = 0  # records overwritten because the buffer was full
+        try:
+            if os.stat(file)[6] != size:
+                raise OSError("wrong size")
+            with open(file, "rb") as f:
+                self._r, self._w, self._used = struct.unpack(_FILE_HEADER,
+                                                             f.read(_FILE_HEADER_SIZE))
+            if self._r >= self._size or self._w >= self._size or self._used > self._size:
+                raise ValueError("corrupt header")
+        except (OSError, ValueError):
+            self._r = self._w = self._used = 0
+            with open(file, "wb") as f:
+                b = bytes(128)
+                for _ in range(size // 128):
+                    f.write(b)
+                f.write(bytes(size % 128))
+            self._writeHeader()
+
+    def __len__(self):
+        """Returns the amount of bytes used by stored records"""
+        return self._used
+
+    def getDroppedRecords(self):
+        return self._dropped
+
+    def _writeHeader(self, f=None):
+        if f is None:
+            with open(self._file, "r+b") as f:
+                f.write(struct.pack(_FILE_HEADER, self._r, self._w, self._used))
+        else:
+            f.seek(0)
+            f.write(struct.pack(_FILE_HEADER, self._r, self._w, self._used))
+
+    def _readRecordHeader(self, f):
+        # returns (topic length, message length, timestamp), topic length 0 on end of data
+        if self._size - self._r < _RECORD_HEADER_SIZE:
+            return 0, 0, 0
+        f.seek(_FILE_HEADER_SIZE + self._r)
+        return struct.unpack(_RECORD_HEADER, f.read(_RECORD_HEADER_SIZE))
+
+    def _skip(self, f):
+        # remove oldest record or skip the end of the data region
+        tl, ml, _ = self._readRecordHeader(f)
+        if tl == 0:
+            self._used -= self._size - self._r
+            self._r = 0
+        else:
+            self._r += _RECORD_HEADER_SIZE + tl + ml
+            self._used -= _RECORD_HEADER_SIZE + tl + ml
+            if self._r == self._size:
+                self._r = 0
+        if self._used == 0:
+            self._r = self._w = 0
+
+    def append(self, topic, msg, timestamp):
+        """
+        Append a publication to the buffer. Overwrites the oldest records if the buffer is full.
+        :param topic: bytes
+        :param msg: bytes
+        :param timestamp: int, time.time() of the publication
+        :return: True if stored, False if the record is bigger than the buffer
+        """
+        n = _RECORD_HEADER_SIZE + len(topic) + len(msg)
+        if n > self._size:
+            return False
+        with open(self._file, "r+b") as f:
+            while True:
+                if self._used == 0:
+                    self._r = self._w = 0
+                if self._w > self._r or self._used == 0:  # free space at end of data region
+                    if self._size - self._w >= n:
+                        break
+                    if self._size - self._w >= _RECORD_HEADER_SIZE:  # mark end of data
+                        f.seek(_FILE_HEADER_SIZE + self._w)
+                        f.write(struct.pack(_RECORD_HEADER, 0, 0, 0))
+                    self._used += self._size - self._w
+                    self._w = 0
+                elif self._r - self._w >= n:
+                    break
+                else:
+                    self._skip(f)
+                    self._dropped += 1
+            f.seek(_FILE_HEADER_SIZE + self._w)
+            f.write(struct.pack(_RECORD_HEADER, len(topic), len(msg), timestamp))
+            f.write(topic)
+            f.write(msg)
+            self._w += n
+            if self._w == self._size:
+                self._w = 0
+            self._used += n
+            self._writeHeader(f)
+        return True
+
+    def peek(self):
+        """
+        Read the oldest record without removing it.
+        :return: (topic, msg, timestamp) as (bytes, bytes, int) or None if empty
+        """
+        with open(self._file, "rb") as f:
+            while self._used:
+                tl, ml, ts = self._readRecordHeader(f)
+                if tl:
+                    return f.read(tl), f.read(ml), ts
+                self._skip(f)  # end of data region, not persisted until next change
+        return None
+
+    def pop(self):
+        """Remove the oldest record"""
+        if self._used:
+            with open(self._file, "r+b") as f:
+                self._skip(f)
+                if self._used and self._readRecordHeader(f)[0] == 0:
+                    self._skip(f)
+                self._writeHeader(f)
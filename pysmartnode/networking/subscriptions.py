@@ -0,0 +1,104 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2020 Released under the MIT license
+# Created on 2026-10-18
+
+__updated__ = "2026-10-18"
+__version__ = "0.2"
+
+# Index of all subscriptions split by topic level so a received topic only has to walk
+# its own levels instead of comparing it against every subscription.
+# Each node is a dict mapping a topic level to its child node. The subscriptions of a node
+# are stored in a list with the key None, subscriptions that also listen to their
+# state topic (command topic without "/set", see check_retained_state) are stored
+# with the key True on the node of the state topic.
+# Matching a topic allocates one str per topic level because dict lookups need a str key.
+# Pass a reused list as result to avoid allocating the result list for every message.
+
+
+class SubscriptionTree:
+    def __init__(self):
+        self._root = {}
+
+    def add(self, topic, sub, state_topic=False):
+        """
+        Add a subscription to the tree.
+        :param topic: subscribed topic, wildcards "+" and "#" are supported
+        :param sub: subscription object that will be returned on match
+        :param state_topic: if the subscription is registered for the state topic
+        :return:
+        """
+        node = self._root
+        s = 0
+        while s != -1:
+            e = topic.find("/", s)
+            level = topic[s:] if e == -1 else topic[s:e]
+            s = -1 if e == -1 else e + 1
+            child = node.get(level)
+            if child is None:
+                child = node[level] = {}
+            node = child
+        key = True if state_topic else None
+        if key not in node:
+            node[key] = [sub]
+        else:
+            node[key].append(sub)
+
+    def remove(self, topic, sub, state_topic=False):
+        """
+        Remove a subscription from the tree. Empty nodes will be removed.
+        :return: True if subscription was found, else False
+        """
+        return self._remove(self._root, topic, 0, sub, True if state_topic else None)[0]
+
+    def _remove(self, node, topic, s, sub, key):
+        # returns (found, node_empty)
+        if s == -1:
+            subs = node.get(key)
+            if subs is None or sub not in subs:
+                return False, False
+            subs.remove(sub)
+            if not subs:
+                del node[key]
+            return True, not node
+        e = topic.find("/", s)
+        level = topic[s:] if e == -1 else topic[s:e]
+        child = node.get(level)
+        if child is None:
+            return False, False
+        found, empty = self._remove(child, topic, -1 if e == -1 else e + 1, sub, key)
+        if empty:
+            del node[level]
+        return found, not node
+
+    def match(self, topic, result=None):
+        """
+        Collect all subscriptions matching the topic.
+        :param topic: received topic without wildcards
+        :param result: optional list the matches will be appended to
+        :return: list of subscriptions
+        """
+        if result is None:
+            result = []
+        self._match(self._root, topic, 0, result)
+        return result
+
+    def _match(self, node, topic, s, result):
+        child = node.get("#")
+        if child is not None and None in child:
+            # matches the parent level too: home/test/# matches home/test
+            result.extend(child[None])
+        if s == -1:  # all levels of topic consumed
+            if None in node:
+                result.extend(node[None])
+            if True in node:
+                result.extend(node[True])
+            return
+        e = topic.find("/", s)
+        level = topic[s:] if e == -1 else topic[s:e]
+        s = -1 if e == -1 else e + 1
+        child = node.get(level)
+        if child is not None:
+            self._match(child, topic, s, result)
+        child = node.get("+")
+        if child is not None:
+            self._match(child, topic, s, result)
@@ -2,13 +2,15 @@
 # Copyright Kevin Köck 2019-2020 Released under the MIT license
 # Created on 2019-04-26 
 
-__updated__ = "2020-08-13"
-__version__ = "1.7"
+__updated__ = "2026-10-18"
+__version__ = "1.11"
 
 from pysmartnode import config
 import uasyncio as asyncio
 from pysmartnode.utils import sys_vars
 from .definitions import *
+from . import discovery_cache
+from .composer import compose, concat
 import gc
 from pysmartnode import logging
 
@@ -21,11 +23,20 @@ from pysmartnode import logging
 
 _mqtt = config.getMQTT()
 
-# prevent multiple discoveries from running concurrently and creating Out-Of-Memory errors
-# or queue overflow errors. This is a starting pointer using _next_component to progress.
-_init_queue_start = None
+# limit concurrent discoveries (config.COMPONENTS_INIT_CONCURRENCY) to prevent Out-Of-Memory
+# errors or queue overflow errors. Components waiting for their network initialization in order.
+_init_queue = []
+_init_running = False
+_init_active = 0  # amount of network initializations running concurrently
+_init_done = asyncio.Event()  # set when a concurrent network initialization finished
 
-_components = None  # pointer list of all registered components, used for mqtt etc
+_components = []  # all registered components in order of registration, used for mqtt etc
+
+_republishing = False  # discovery messages of all components are being published again
+
+# entities of the device discovery if config.MQTT_DISCOVERY_DEVICE, {unique_name: bytearray}
+_device_components = {}
+_device_changed = False
 
 
 class ComponentBase:
@@ -42,22 +53,13 @@ class ComponentBase:
         :param discover: if the component should send a discovery message, used in Home-Assistant.
         :param logger: optional logger instance. If not provided, one will be created with the component name
         """
-        self._next_component = None  # needed to keep a list of registered components
-        global _components
-        if _components is None:
-            _components = self
-        else:
-            c = _components
-            while c is not None:
-                if c._next_component is None:
-                    c._next_component = self
-                    break
-                c = c._next_component
+        _components.append(self)
         # Workaround to prevent every component object from creating a new asyncio task for
         # network oriented initialization as this would cause a big RAM demand.
-        global _init_queue_start
-        if _init_queue_start is None:
-            _init_queue_start = self
+        global _init_running
+        _init_queue.append(self)
+        if not _init_running:
+            _init_running = True
             asyncio.create_task(self.__initNetworkProcess())
         self.COMPONENT_NAME = component_name
         self.VERSION = version
@@ -75,18 +77,11 @@ class ComponentBase:
             return False
         # call cleanup method, should stop running loops
         await component._remove()
-        global _components
-        c = _components
-        p = None
-        while c is not None:
-            if c == component:
-                if p is None:
-                    _components = c._next_component
-                    break
-                p._next_component = c._next_component
-                break
-            p = c
-            c = c._next_component
+        if component in _init_queue:
+            _init_queue.remove(component)
+        if component in _components:
+            _components.remove(component)
+        config.removeComponent(component)
 
     async def _remove(self):
         """
@@ -100,16 +95,103 @@ class ComponentBase:
                                    timeout=5)
         if config.MQTT_DISCOVERY_ENABLED and self.__discover:
             await self._discovery(False)
+            await ComponentBase.__publishDeviceDiscovery()
+            if config.MQTT_DISCOVERY_CACHE:
+                discovery_cache.save()  # once for all deleted discovery messages
 
     @staticmethod
     async def __initNetworkProcess():
-        global _init_queue_start
-        c = _init_queue_start
-        while c is not None:
-            await c._init_network()
+        global _init_running
+        global _init_active
+        limit = config.COMPONENTS_INIT_CONCURRENCY
+        while _init_queue or _init_active:
+            if _init_queue and limit <= 1:
+                await _init_queue.pop(0)._init_network()  # no extra task on small devices
+                gc.collect()
+            elif _init_queue and (_init_active == 0 or (
+                    _init_active < limit and ComponentBase.__ramAvailable())):
+                _init_active += 1
+                asyncio.create_task(ComponentBase.__initNetwork(_init_queue.pop(0)))
+            else:  # wait for a running initialization to finish
+                _init_done.clear()
+                await _init_done.wait()
+        _init_running = False  # no await since the queue was empty, no component can be missed
+        await ComponentBase.__publishDeviceDiscovery()
+        if config.MQTT_DISCOVERY_CACHE:
+            discovery_cache.save()
+
+    @staticmethod
+    async def __initNetwork(component):
+        global _init_active
+        try:
+            await component._init_network()
+        finally:
+            _init_active -= 1
+            gc.collect()
+            _init_done.set()
+
+    @staticmethod
+    def __ramAvailable():
+        if gc.mem_free() >= config.COMPONENTS_INIT_MIN_FREE_RAM:
+            return True
+        gc.collect()
+        return gc.mem_free() >= config.COMPONENTS_INIT_MIN_FREE_RAM
+
+    @staticmethod
+    def _homeassistantStatus(topic, msg, retained):
+        # Home-Assistant publishes "online" when it starts and needs all discovery messages
+        global _republishing
+        if msg == "online" and not retained and not _republishing:
+            _republishing = True
+            asyncio.create_task(ComponentBase.__republishDiscovery())
+
+    @staticmethod
+    async def __republishDiscovery():
+        global _republishing
+        try:
+            if config.MQTT_DISCOVERY_CACHE:
+                discovery_cache.clear()  # publish all discovery messages
+            for c in tuple(_components):  # components can be removed in the meantime
+                if c.__discover:
+                    await c._discovery(True)
+                    gc.collect()
+            await ComponentBase.__publishDeviceDiscovery(True)
+            if config.MQTT_DISCOVERY_CACHE:
+                discovery_cache.save()
+        finally:
+            _republishing = False
+
+    @staticmethod
+    async def __publishDeviceDiscovery(force=False):
+        # publish all entities in one device discovery message if they changed
+        global _device_changed
+        if not config.MQTT_DISCOVERY_DEVICE or not (_device_changed or force):
+            return
+        _device_changed = False
+        topic = "{!s}/device/{!s}/config".format(config.MQTT_DISCOVERY_PREFIX,
+                                                 sys_vars.getDeviceID())
+        if not _device_components:
+            msg = ""
+        else:
+            parts = [compose(DISCOVERY_DEVICE, sys_vars.getDeviceDiscovery(), config.VERSION,
+                             ComponentBase._composeAvailability())]
+            for c in _device_components.values():
+                if len(parts) > 1:
+                    parts.append(b",")
+                parts.append(c)
+            parts.append(b"}}")
+            msg = concat(parts)
+            del parts
             gc.collect()
-            c = c._next_component
-        _init_queue_start = None
+        if config.MQTT_DISCOVERY_CACHE and discovery_cache.isPublished(topic, msg):
+            return
+        if await _mqtt.publish(topic, msg, qos=1, retain=True):
+            if config.MQTT_DISCOVERY_CACHE:
+                discovery_cache.store(topic, msg)
+        else:
+            _device_changed = True  # try again with the next change
+        del msg
+        gc.collect()
 
     async def _init_network(self):
         await config._log.asyncLog("info", "Added module", self.COMPONENT_NAME, "version",
@@ -133,17 +215,38 @@ class ComponentBase:
     @staticmethod
     async def _publishDiscovery(component_type, component_topic, unique_name, discovery_type,
                                 friendly_name=None):
+        global _device_changed
+        if config.MQTT_DISCOVERY_DEVICE:
+            component_topic = component_topic if _mqtt.isDeviceTopic(
+                component_topic) is False else _mqtt.getRealTopic(component_topic)
+            c = compose(DISCOVERY_DEVICE_COMPONENT, unique_name, component_type, component_topic,
+                        friendly_name or unique_name, discovery_type, sys_vars.getDeviceID(),
+                        unique_name)
+            if _device_components.get(unique_name) != c:
+                _device_components[unique_name] = c
+                _device_changed = True
+            return  # published by __publishDeviceDiscovery
         topic = ComponentBase._getDiscoveryTopic(component_type, unique_name)
         msg = ComponentBase._composeDiscoveryMsg(component_topic, unique_name, discovery_type,
                                                  friendly_name)
-        await _mqtt.publish(topic, msg, qos=1, retain=True)
+        if config.MQTT_DISCOVERY_CACHE and discovery_cache.isPublished(topic, msg):
+            return  # still retained by the broker since it was published before a reset
+        if await _mqtt.publish(topic, msg, qos=1, retain=True) and config.MQTT_DISCOVERY_CACHE:
+            discovery_cache.store(topic, msg)
         del msg, topic
         gc.collect()
 
     @staticmethod
     async def _deleteDiscovery(component_type, unique_name):
+        global _device_changed
+        if config.MQTT_DISCOVERY_DEVICE:
+            if _device_components.pop(unique_name, None) is not None:
+                _device_changed = True
+            return  # published by __publishDeviceDiscovery
         topic = ComponentBase._getDiscoveryTopic(component_type, unique_name)
         await _mqtt.publish(topic, "", qos=1, retain=True)
+        if config.MQTT_DISCOVERY_CACHE:
+            discovery_cache.remove(topic)  # saved by _remove or the next network initialization
 
     @staticmethod
     def _composeAvailability():
@@ -160,18 +263,19 @@ class ComponentBase:
         :param component_type_discovery: discovery values for the component type, e.g. switch, sensor
         :param friendly_name: optional a readable name that is used in the gui and entity_id
         :param no_avail: don't add availability configs (typically only used for the availability component itself)
-        :return: str
+        :return: bytearray, composed without creating the message as str first
         """
         friendly_name = friendly_name or name
         component_topic = component_topic if _mqtt.isDeviceTopic(
             component_topic) is False else _mqtt.getRealTopic(
             component_topic)
-        return DISCOVERY_BASE.format(component_topic,  # "~" component state topic
-                                     friendly_name,  # name
-                                     sys_vars.getDeviceID(), name,  # unique_id
-                                     "" if no_avail else ComponentBase._composeAvailability(),
-                                     component_type_discovery,  # component type specific values
-                                     sys_vars.getDeviceDiscovery())  # device
+        return compose(DISCOVERY_BASE,
+                       component_topic,  # "~" component state topic
+                       friendly_name,  # name
+                       sys_vars.getDeviceID(), name,  # unique_id
+                       "" if no_avail else ComponentBase._composeAvailability(),
+                       component_type_discovery,  # component type specific values
+                       sys_vars.getDeviceDiscovery())  # device
 
     @staticmethod
     def _composeSensorType(device_class, unit_of_measurement="", value_template=VALUE_TEMPLATE,
@@ -200,3 +304,9 @@ class ComponentBase:
         from .switch import ComponentSwitch
         if not isinstance(obj, ComponentSwitch):
             raise TypeError("{!s} is not of instance ComponentSwitch".format(obj))
+
+
+if config.MQTT_DISCOVERY_ENABLED:
+    _mqtt.subscribeSync("{!s}/status".format(config.MQTT_DISCOVERY_PREFIX),
+                        ComponentBase._homeassistantStatus, None, qos=1,
+                        payload_type=_mqtt.PAYLOAD_STR)
@@ -2,12 +2,11 @@
 # Copyright Kevin Köck 2019-2020 Released under the MIT license
 # Created on 2019-09-10 
 
-__updated__ = "2020-04-02"
-__version__ = "0.91"
+__updated__ = "2026-10-18"
+__version__ = "0.93"
 
 from .switch import ComponentSwitch
 from pysmartnode import config
-import uasyncio as asyncio
 
 _mqtt = config.getMQTT()
 
@@ -43,16 +42,12 @@ class ComponentButton(ComponentSwitch):
         if self._lock.locked() is True and self._wfl is False:
             return False
         async with self._lock:
-            if self._pub_task:
-                self._pub_task.cancel()  # cancel if not finished, e.g. if activated quickly again
-            self._pub_task = asyncio.create_task(self._publish("ON"))
-            # so device gets activated as quickly as possible
+            await self._publish("ON")
+            # queued so device gets activated as quickly as possible
             self._state = True
             await self._on()
             self._state = False
-            if self._pub_task:
-                self._pub_task.cancel()  # cancel if not finished, e.g. if _on() is very fast
-            self._pub_task = asyncio.create_task(self._publish("OFF"))
+            await self._publish("OFF")  # replaces "ON" if not published yet, e.g. if _on() is very fast
             return True
 
     async def off(self):
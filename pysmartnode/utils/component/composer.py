@@ -0,0 +1,73 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2020 Released under the MIT license
+# Created on 2026-10-18
+
+__updated__ = "2026-10-18"
+__version__ = "0.1"
+
+# Formats big messages like discovery messages directly into one bytearray of the exact size.
+# str.format builds the message as str and publishing needs another copy as bytes, while
+# compose only allocates the resulting bytearray and small fragments of the template and args.
+
+import gc
+
+
+def _fragments(template, args):
+    # yields the literal parts of the template and the args as str, supports {}, {!s}, {{ and }}
+    i = 0
+    n = 0
+    while True:
+        a = template.find("{", i)
+        b = template.find("}", i)
+        j = a if b < 0 or 0 <= a < b else b
+        if j < 0:
+            if i < len(template):
+                yield template[i:]
+            return
+        if j > i:
+            yield template[i:j]
+        c = template[j]
+        if j + 1 < len(template) and template[j + 1] == c:  # escaped brace
+            yield c
+            i = j + 2
+        else:  # placeholder
+            arg = args[n]
+            n += 1
+            yield arg if type(arg) == str else str(arg)
+            i = template.index("}", j) + 1
+
+
+def compose(template, *args) -> bytearray:
+    """
+    Like template.format(*args).encode() but without creating the message as str.
+    :param template: str with placeholders {} or {!s}, braces escaped as {{ and }}
+    :param args: values of the placeholders, converted with str()
+    :return: bytearray
+    """
+    size = 0
+    for f in _fragments(template, args):
+        size += len(f.encode())
+    gc.collect()  # fragments are garbage, free RAM for the contiguous message
+    msg = bytearray(size)
+    mv = memoryview(msg)
+    pos = 0
+    for f in _fragments(template, args):
+        f = f.encode()
+        mv[pos:pos + len(f)] = f
+        pos += len(f)
+    return msg
+
+
+def concat(parts) -> bytearray:
+    """
+    Concatenate bytes-like parts into one bytearray of the exact size.
+    :param parts: list of bytes or bytearray
+    :return: bytearray
+    """
+    msg = bytearray(sum(len(p) for p in parts))
+    mv = memoryview(msg)
+    pos = 0
+    for p in parts:
+        mv[pos:pos + len(p)] = p
+        pos += len(p)
+    return msg
@@ -2,8 +2,8 @@
 # Copyright Kevin Köck 2019-2020 Released under the MIT license
 # Created on 2019-09-10 
 
-__updated__ = "2020-08-13"
-__version__ = "0.5"
+__updated__ = "2026-10-18"
+__version__ = "0.6"
 
 # The discovery base should be a json string to keep the RAM requirement low and only need
 # to use format to enter the dynamic values so that the string is only loaded into RAM once
@@ -21,6 +21,23 @@ DISCOVERY_BASE = '{{' \
                  '"dev":{!s}' \
                  '}}'
 
+# Device discovery publishing all entities of a device in one message, see MQTT_DISCOVERY_DEVICE.
+# DISCOVERY_DEVICE is followed by the comma separated DISCOVERY_DEVICE_COMPONENT and "}}".
+DISCOVERY_DEVICE = '{{' \
+                   '"dev":{!s},' \
+                   '"o":{{"name":"pysmartnode","sw":"{!s}"}},' \
+                   '{!s}' \
+                   '"cmps":{{'
+
+DISCOVERY_DEVICE_COMPONENT = '"{!s}":{{' \
+                             '"p":"{!s}",' \
+                             '"~":"{!s}",' \
+                             '"name":"{!s}",' \
+                             '"stat_t":"~",' \
+                             '{!s}' \
+                             '"uniq_id":"{!s}_{!s}"' \
+                             '}}'
+
 DISCOVERY_AVAILABILITY = '"avty_t":"{!s}/{!s}/{!s}",'
 #                 '"pl_avail":"online",' \
 #                 '"pl_not_avail":"offline",' \
@@ -39,6 +56,9 @@ DISCOVERY_BINARY_SENSOR = '"dev_cla":"{!s}",' \
 
 DISCOVERY_SWITCH = '"cmd_t":"~/set",'  # '"stat_on":"ON","stat_off":"OFF",' are default
 
+DISCOVERY_ATTRIBUTES = '"json_attr_t":"{!s}",' \
+                       '"json_attr_tpl":"{{{{ value_json.{!s}|tojson }}}}",'
+
 VALUE_TEMPLATE_JSON = "{{{{ value_json.{!s} }}}}"
 VALUE_TEMPLATE_FLOAT = "{{ value|float }}"
 VALUE_TEMPLATE_INT = "{{ value|int }}"
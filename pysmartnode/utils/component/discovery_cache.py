@@ -0,0 +1,92 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2020 Released under the MIT license
+# Created on 2026-10-18
+
+__updated__ = "2026-10-18"
+__version__ = "0.1"
+
+# Hashes of the published discovery messages, stored in a file so unchanged discovery messages
+# don't have to be published again after a reset as they are retained by the broker.
+# Stored as pairs of crc32(topic), crc32(message) in an array, only 8 Bytes per discovery.
+
+from array import array
+import ubinascii
+
+_FILE = "discovery.bin"
+
+_hashes = None  # array("I") of pairs (crc32 of topic, crc32 of message)
+_changed = False
+
+
+def _load():
+    global _hashes
+    _hashes = array("I")
+    try:
+        with open(_FILE, "rb") as f:
+            _hashes = array("I", f.read())
+    except OSError:
+        pass
+    if len(_hashes) % 2:  # incomplete file
+        _hashes = array("I")
+
+
+def _index(t):
+    for i in range(0, len(_hashes), 2):
+        if _hashes[i] == t:
+            return i
+    return -1
+
+
+def isPublished(topic, msg) -> bool:
+    """Returns True if the message was the last one published to this discovery topic"""
+    if _hashes is None:
+        _load()
+    i = _index(ubinascii.crc32(topic))
+    return i >= 0 and _hashes[i + 1] == ubinascii.crc32(msg)
+
+
+def store(topic, msg):
+    """Store the hash of a published discovery message"""
+    global _changed
+    if _hashes is None:
+        _load()
+    t = ubinascii.crc32(topic)
+    m = ubinascii.crc32(msg)
+    i = _index(t)
+    if i < 0:
+        _hashes.append(t)
+        _hashes.append(m)
+    elif _hashes[i + 1] != m:
+        _hashes[i + 1] = m
+    else:
+        return
+    _changed = True
+
+
+def remove(topic):
+    """Remove the hash of a deleted discovery message"""
+    global _changed, _hashes
+    if _hashes is None:
+        _load()
+    i = _index(ubinascii.crc32(topic))
+    if i >= 0:
+        # slice deletion of arrays is not supported on all ports, move the last pair instead
+        _hashes[i] = _hashes[-2]
+        _hashes[i + 1] = _hashes[-1]
+        _hashes = _hashes[:-2]
+        _changed = True
+
+
+def clear():
+    """Forget published messages (not in the file) so all discoveries get published again"""
+    global _hashes
+    _hashes = array("I")
+
+
+def save():
+    """Write the hashes to the file if they changed"""
+    global _changed
+    if _changed:
+        with open(_FILE, "wb") as f:
+            f.write(_hashes)
+        _changed = False
@@ -0,0 +1,56 @@
+# Author: Kevin Köck
+# Copyright Kevin Köck 2020 Released under the MIT license
+# Created on 2026-10-18
+
+__updated__ = "2026-10-18"
+__version__ = "0.2"
+
+# Fixed size ring buffer of the last readings of a sensor_type with their ticks_ms timestamp.
+# Values are stored as float32, so a reading only needs 8 bytes.
+
+from array import array
+import time
+
+
+class History:
+    def __init__(self, size):
+        """
+        :param size: amount of readings to keep
+        """
+        self._vals = array("f", bytes(4 * size))
+        self._ts = array("i", bytes(4 * size))
+        self._i = 0  # next write position
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def append(self, value, timestamp):
+        """
+        :param value: int, float or bool
+        :param timestamp: ticks_ms of the reading
+        """
+        self._vals[self._i] = value
+        self._ts[self._i] = timestamp
+        self._i = (self._i + 1) % len(self._vals)
+        if self._len < len(self._vals):
+            self._len += 1
+
+    def get(self, since_ms=None, precision=None):
+        """
+        Returns the readings, oldest first.
+        :param since_ms: ticks_ms, only return readings newer than this timestamp
+        :param precision: digits after separator "." the values are rounded to, as float32
+        can't represent most decimal values. None returns the stored values.
+        :return: list of tuples (ticks_ms, value)
+        """
+        size = len(self._vals)
+        res = []
+        for k in range(self._len):
+            j = (self._i - self._len + k) % size
+            if since_ms is None or time.ticks_diff(self._ts[j], since_ms) > 0:
+                v = self._vals[j]
+                if precision is not None:
+                    v = round(v, precision) if precision else round(v)
+                res.append((self._ts[j], v))
+        return res
@@ -2,25 +2,22 @@
 # Copyright Kevin Köck 2019-2020 Released under the MIT license
 # Created on 2019-10-27 
 
-__updated__ = "2020-08-18"
-__version__ = "0.9.3"
+__updated__ = "2026-10-18"
+__version__ = "0.9.14"
 
 from pysmartnode.utils.component import ComponentBase
 from pysmartnode import config
 from .definitions import *
+from .history import History
 import uasyncio as asyncio
 import gc
 import time
 import sys
 import io
+from array import array
 from micropython import const
 
-try:
-    import urandom as random
-except:
-    import random
-
-# sensor value lookup table
+# sensor metadata lookup table
 _iPRECISION = const(0)
 _iOFFSET = const(1)
 _iVALUE_TEMPLATE = const(2)
@@ -31,17 +28,144 @@ _iDISC_TYPE = const(6)
 _iBINARY_SENSOR = const(7)
 _iUNIQUE_NAME = const(8)
 _iRETAINED_PUB = const(9)
-_iTIMESTAMP = const(-2)
-_iVALUE = const(-1)
+_iDEADBAND = const(10)
+_iDEADBAND_REL = const(11)
+_iAGGREGATE = const(12)
+
+# aggregate array of a sensor_type
+_aMIN = const(0)
+_aMAX = const(1)
+_aSUM = const(2)
+_aCOUNT = const(3)
+
+_NO_TIMESTAMP = const(-1)  # no successful sensor reading yet
 
 _mqtt = config.getMQTT()
+_metadata = {}  # identical metadata tuples of all sensor objects, so they are only stored once
+
+_START_DELAY = const(1000)  # delay of the first reading to give network operations a chance
+_START_SPACING = const(250)  # space between first readings of sensors added at the same time
+
+
+class _Scheduler:
+    """
+    Single task reading all sensors periodically instead of one loop task per sensor.
+    Entries [due, sensor, start] are kept sorted by their due time (ticks_ms, therefore no
+    heap as ticks wrap around), the task sleeps until the first entry is due or the
+    schedule changes. Each reading runs in its own task so slow sensors don't delay others.
+    """
+
+    def __init__(self):
+        self._due = []
+        self._event = asyncio.Event()  # wakes up the task when the schedule changes
+        self._task = None
+        self._next_start = 0  # ticks_ms of the next first reading
+        self.wakeups = 0  # for benchmarks
+
+    def add(self, sensor):
+        """Schedule the first reading of a sensor"""
+        now = time.ticks_ms()
+        start = time.ticks_add(now, _START_DELAY)
+        if time.ticks_diff(self._next_start, start) > 0:
+            start = self._next_start
+        self._next_start = time.ticks_add(start, _START_SPACING)
+        sensor._sched = [start, sensor, None]
+        self._insert(sensor._sched)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def remove(self, sensor):
+        e = sensor._sched
+        sensor._sched = None
+        if e is not None and e in self._due:
+            self._due.remove(e)
+
+    def update(self, sensor):
+        """Apply a changed reading interval"""
+        e = sensor._sched
+        iv = int(sensor._intrd * 1000)
+        if iv <= 0:
+            self.remove(sensor)
+        elif e is None:
+            self.add(sensor)
+        elif e[2] is not None and e in self._due:  # not running and not waiting for first read
+            self._due.remove(e)
+            e[0] = time.ticks_add(e[2], iv)
+            if time.ticks_diff(e[0], time.ticks_ms()) < 0:
+                e[0] = time.ticks_ms()
+            self._insert(e)
+
+    def done(self, e):
+        """Schedule the next reading once a reading is finished"""
+        s = e[1]
+        iv = int(s._intrd * 1000)
+        if s._sched is not e or iv <= 0:
+            return  # removed or not read periodically anymore
+        now = time.ticks_ms()
+        if e[2] is None:  # first reading, spread following readings over the interval
+            e[0] = time.ticks_add(now, self._spread(now, iv))
+        else:
+            e[0] = time.ticks_add(e[0], iv)  # keep reading rate stable
+            if time.ticks_diff(e[0], now) < 0:  # reading took longer than interval
+                e[0] = now
+        e[2] = now
+        self._insert(e)
+
+    def _spread(self, now, iv):
+        # returns a delay between iv/2 and iv in the biggest gap between other readings
+        prev = iv // 2
+        best = -1
+        res = iv
+        for e in self._due:
+            t = time.ticks_diff(e[0], now)
+            if t <= prev:
+                continue
+            if t > iv:
+                break
+            if (t - prev) // 2 > best:
+                best = (t - prev) // 2
+                res = prev + best
+            prev = t
+        if iv - prev > best:  # distance to the last reading in the interval
+            res = iv
+        return res
+
+    def _insert(self, e):
+        d = self._due
+        i = len(d)
+        while i > 0 and time.ticks_diff(d[i - 1][0], e[0]) > 0:
+            i -= 1
+        d.insert(i, e)
+        if i == 0:  # task is sleeping for a later reading
+            self._event.set()
+
+    async def _run(self):
+        d = self._due
+        while True:
+            while d and time.ticks_diff(d[0][0], time.ticks_ms()) <= 0:
+                e = d.pop(0)
+                e[1]._loop_task = asyncio.create_task(e[1]._cycle(e))
+            self._event.clear()
+            if not d:
+                await self._event.wait()
+            else:
+                try:
+                    await asyncio.wait_for_ms(self._event.wait(),
+                                              time.ticks_diff(d[0][0], time.ticks_ms()))
+                except asyncio.TimeoutError:
+                    pass
+            self.wakeups += 1
+
+
+_scheduler = _Scheduler()
 
 
 class ComponentSensor(ComponentBase):
     def __init__(self, component_name, version, unit_index: int, interval_publish=None,
                  interval_reading=None, mqtt_topic=None,
                  expose_intervals=False, intervals_topic=None,
-                 publish_old_values=False, **kwargs):
+                 publish_old_values=False, deadbands=None, aggregate=None, history=None,
+                 **kwargs):
         """
         :param component_name: Name of the component, used for default topics and logging
         :param version: version of the component module, used for logging purposes
@@ -52,42 +176,67 @@ class ComponentSensor(ComponentBase):
         :param expose_intervals: Expose intervals to mqtt so they can be changed remotely
         :param intervals_topic: if expose_intervals then use this topic to change intervals.
         Defaults to <home>/<device-id>/<COMPONENT_NAME><_unit_index>/interval/set
-        :param publish_old_values: Publish old values if the reading interval is higher than the publication can handle.
-        Otherwise a publication is canceled and started again, which could result in a loop of never successful publication attempts if the read interval is high.
+        :param publish_old_values: Publications of the loop time out after 5s instead of waiting for the connection.
+        Publications are queued and a value that hasn't been published yet is replaced by the newest reading in both cases.
+        :param deadbands: optional dict {sensor_type: absolute} or {sensor_type: [absolute, relative]}
+        overriding the deadbands of _addSensorType, e.g. {"temperature": [0.5, None]}
+        :param aggregate: optional, True to aggregate all sensor_types, False for none or a list
+        of sensor_types, overriding aggregate of _addSensorType.
+        :param history: optional, amount of readings to keep in RAM for all sensor_types or a dict
+        {sensor_type: amount}, overriding history of _addSensorType.
         """
         super().__init__(component_name, version, unit_index, **kwargs)
-        self._values = {}
+        # Each sensor_type has the same index in all lists. Static metadata is an immutable
+        # tuple shared between sensor objects, only values and timestamps are per object.
+        self._types = []
+        self._meta = []
+        self._vals = []
+        self._ts = array("i")  # ticks_ms of last reading that is not None
+        self._published = None  # last published values, only used if a deadband is configured
+        self._deadbands = deadbands
+        self._aggregate = aggregate
+        self._aggr = None  # array [min, max, sum, count] of aggregated sensor_types, else None
+        self._history = history
+        self._hist = None  # History of sensor_types keeping readings, else None
         # _intpb can be >0, -1 for not publishing or 0/None for config.INTERVAL_SENSOR_PUBLISH
         self._intpb: float = interval_publish or config.INTERVAL_SENSOR_PUBLISH
         self._intrd: float = config.INTERVAL_SENSOR_READ if interval_reading is None else interval_reading
         if self._intrd > self._intpb > 0:
             raise ValueError("interval_publish can't be lower than interval_reading")
         self._topic = mqtt_topic  # can be None
+        self._real_topic = None  # compiled topic of all sensor_types without their own topic
         self._event = None
-        self._reading: bool = False  # cheaper than Lock
+        self._flight = None  # [Event, result, Task] of the reading in progress, see _readOnce
         if expose_intervals:
             tp = intervals_topic or _mqtt.getDeviceTopic(
                 "{!s}/interval/set".format(self._default_name()))
             _mqtt.subscribeSync(tp, self.setInterval, self, qos=1, check_retained_state=True)
             self._log.info("Exposing intervals on topic", tp, local_only=True)
-        self._loop_task = None
-        if self._intrd > 0:  # if interval_reading==-1 no loop will be started
-            self._loop_task = asyncio.create_task(self._loop())
-            # self._loop_task will get canceled when component is removed.
+        self._loop_task = None  # task of the current reading, see _cycle
+        self._sched = None  # entry of the scheduler
+        self._publish_count = float("inf")  # readings since the last publication
+        if self._intrd > 0:  # if interval_reading==-1 it won't be read periodically
+            _scheduler.add(self)
+            # will get removed from the scheduler when component is removed.
         self._ignore_stale = publish_old_values
         gc.collect()
 
     async def _remove(self):
         """Called by component base class when a sensor component should be removed"""
+        _scheduler.remove(self)
         if self._loop_task is not None:
             self._loop_task.cancel()
+        if self._flight is not None:
+            self._flight[2].cancel()
         await super()._remove()
 
     def _addSensorType(self, sensor_type: str, precision: int = 0, offset: float = 0.0,
                        value_template: str = VALUE_TEMPLATE, unit_of_meas: str = "",
                        friendly_name: str = None, topic: str = None,
                        discovery_type: str = None, binary_sensor: bool = False,
-                       unique_name: str = None, retained_publication: bool = False):
+                       unique_name: str = None, retained_publication: bool = False,
+                       deadband: float = None, deadband_relative: float = None,
+                       aggregate: bool = False, history: int = 0):
         """
         :param sensor_type: Name of the sensor type, preferrably used by references to .definitons module
         :param precision: digits after separator "."
@@ -101,16 +250,76 @@ class ComponentSensor(ComponentBase):
         :param binary_sensor: if sensor is a binary_sensor, otherwise default sensor.
         :param unique_name: Sensor name for discovery. Has to be unique. Optional, will get generated.
         :param retained_publication: publish the sensor readings as retained messages.
+        :param deadband: publish all readings immediately once the value differs more than
+        deadband from the last published value. interval_publish is then the maximum age of a
+        published value, or the only publication if interval_publish is -1.
+        0 publishes every change, non-numeric values are published on every change.
+        :param deadband_relative: like deadband but relative to the last published value,
+        e.g. 0.05 for 5%. If both are set, exceeding either one results in a publication.
+        :param aggregate: calculate min, max, mean and count of all numeric readings between
+        publications and publish them with the last reading to <sensor topic>/aggregate.
+        They are available as attributes of the sensor in homeassistant.
+        :param history: amount of numeric readings to keep in RAM, see getHistory. A request to
+        <home>/<device-id>/<name>/history/set publishes them to <home>/<device-id>/<name>/history
         :return:
         """
-        self._values[sensor_type] = [int(precision), float(offset), value_template, unit_of_meas,
-                                     friendly_name, topic, discovery_type, binary_sensor,
-                                     unique_name, retained_publication, None, None]
-        # value[-1] is last sensor reading, value[-2] is timestamp of last reading that is not None
+        if self._deadbands and sensor_type in self._deadbands:
+            deadband = self._deadbands[sensor_type]
+            if type(deadband) in (list, tuple):
+                deadband, deadband_relative = deadband
+        if self._aggregate is not None:
+            if type(self._aggregate) == bool:  # False disables aggregation of all sensor_types
+                aggregate = self._aggregate
+            else:
+                aggregate = sensor_type in self._aggregate
+        if type(self._history) == int:
+            history = self._history
+        elif self._history and sensor_type in self._history:
+            history = self._history[sensor_type]
+        # topics are resolved once so publishing doesn't have to build them again
+        if topic is not None:
+            topic = _mqtt.compileTopic(topic)
+        m = (int(precision), float(offset), value_template, unit_of_meas, friendly_name, topic,
+             discovery_type, binary_sensor, unique_name, retained_publication, deadband,
+             deadband_relative, aggregate)
+        m = _metadata.setdefault(m, m)
+        if (deadband is not None or deadband_relative is not None) and self._published is None:
+            self._published = [None] * len(self._types)
+        if aggregate and self._aggr is None:
+            self._aggr = [None] * len(self._types)
+        sub = history and self._hist is None
+        if sub:
+            self._hist = [None] * len(self._types)
+        if sensor_type in self._types:
+            i = self._types.index(sensor_type)
+            self._meta[i] = m
+            self._vals[i] = None
+            self._ts[i] = _NO_TIMESTAMP
+            if self._published is not None:
+                self._published[i] = None
+        else:
+            i = len(self._types)
+            self._types.append(sensor_type)
+            self._meta.append(m)
+            self._vals.append(None)
+            self._ts.append(_NO_TIMESTAMP)
+            if self._published is not None:
+                self._published.append(None)
+            if self._aggr is not None:
+                self._aggr.append(None)
+            if self._hist is not None:
+                self._hist.append(None)
+        if self._aggr is not None:
+            self._aggr[i] = array("f", (0, 0, 0, 0)) if aggregate else None
+        if self._hist is not None:
+            self._hist[i] = History(history) if history else None
+        if sub:
+            _mqtt.subscribeSync(_mqtt.getDeviceTopic(
+                "{!s}/history/set".format(self._default_name())), self._historyRequest, self)
+        self._real_topic = _mqtt.compileTopic(
+            self._topic or _mqtt.getDeviceTopic(self._default_name()))
         self._log.info("Sensor", self._default_name(), "will publish readings for", sensor_type,
-                       "to topic", _mqtt.getRealTopic(
-                topic or self._topic or _mqtt.getDeviceTopic(self._default_name())),
-                       local_only=True)
+                       "to topic", topic or self._real_topic, local_only=True)
 
     def setReadingInterval(self, *args):
         """
@@ -122,6 +331,7 @@ class ComponentSensor(ComponentBase):
         :return:
         """
         self._intrd = float(args[0] if len(args) == 1 else args[1])
+        _scheduler.update(self)
         return True
 
     def setPublishInterval(self, *args):
@@ -164,30 +374,72 @@ class ComponentSensor(ComponentBase):
         """
         Publish all current sensor readings.
         Ususally used internally but can be called externally to control the publication (e.g. if automatic publications are disabled).
+        The readings are put into the publish queue and replace queued readings of the same topic.
+        Without connection they are stored if config.MQTT_STORE_FORWARD_SIZE is set.
         :param timeout: timeout for each publication operation
         :return:
         """
         d = {}
-        t = self._topic or _mqtt.getDeviceTopic(self._default_name())
-        for sensor_type in self._values:
-            val = self._values[sensor_type]
-            if val[_iVALUE] is not None:
+        last = None  # metadata of the last value in d
+        for i, sensor_type in enumerate(self._types):
+            msg = self._vals[i]
+            if msg is not None:
+                val = self._meta[i]
                 if val[_iTOPIC] is None:  # no topic for sensor_type
-                    d[sensor_type] = val[_iVALUE]
+                    d[sensor_type] = msg
+                    last = val
                 else:
-                    msg = val[_iVALUE]
                     if type(msg) == bool and val[_iBINARY_SENSOR]:  # binary sensor
                         msg = _mqtt.payload_on[0] if msg else _mqtt.payload_off[0]
                     elif sys.platform in ("esp32", "pyboard") and type(msg) == float:
                         msg = ("{0:." + str(val[0]) + "f}").format(msg)
                         # on some platforms this might make sense as a workaround for 25.3000000001
-                    await _mqtt.publish(val[_iTOPIC], msg, qos=1, timeout=timeout,
-                                        retain=val[_iRETAINED_PUB])
-        if len(d) == 1 and "value_json" not in self._values[list(d.keys())[0]][_iVALUE_TEMPLATE]:
+                    _mqtt.schedulePublish(val[_iTOPIC], msg, qos=1, timeout=timeout,
+                                          retain=val[_iRETAINED_PUB], coalesce=True, store=True)
+        if len(d) == 1 and "value_json" not in last[_iVALUE_TEMPLATE]:
             # topic has no json template so send it without dict
             d = d[list(d.keys())[0]]
         if type(d) != dict or len(d) > 0:  # single value or dict with at least one entry
-            await _mqtt.publish(t, d, qos=1, timeout=timeout)
+            _mqtt.schedulePublish(self._real_topic, d, qos=1, timeout=timeout, coalesce=True, store=True)
+        if self._published is not None:
+            for i, v in enumerate(self._vals):
+                self._published[i] = v
+        if self._aggr is not None:
+            self._publishAggregates(timeout)
+
+    def _publishAggregates(self, timeout):
+        # publish aggregates of the readings since the last publication and start a new window
+        d = {}
+        for i, a in enumerate(self._aggr):
+            if a is not None and a[_aCOUNT]:
+                p = self._meta[i][_iPRECISION]
+                d[self._types[i]] = {"min": round(a[_aMIN], p), "max": round(a[_aMAX], p),
+                                     "mean": round(a[_aSUM] / a[_aCOUNT], p),
+                                     "count": int(a[_aCOUNT]), "last": self._vals[i]}
+                a[_aCOUNT] = 0
+        if d:
+            _mqtt.schedulePublish(self._real_topic + "/aggregate", d, qos=1, timeout=timeout,
+                                  coalesce=True, store=True)
+
+    def _deadbandExceeded(self) -> bool:
+        """Returns True if a value differs from the last published value more than its deadband"""
+        if self._published is None:
+            return False
+        for i, val in enumerate(self._meta):
+            db = val[_iDEADBAND]
+            rel = val[_iDEADBAND_REL]
+            v = self._vals[i]
+            if (db is None and rel is None) or v is None:  # failed readings are no change
+                continue
+            last = self._published[i]
+            if last is None or type(v) not in (int, float) or type(last) not in (int, float):
+                if v != last:
+                    return True
+                continue
+            diff = abs(v - last)
+            if (db is not None and diff > db) or (rel is not None and diff > abs(last) * rel):
+                return True
+        return False
 
     def _default_name(self):
         """
@@ -196,11 +448,11 @@ class ComponentSensor(ComponentBase):
         return "{!s}{!s}".format(self.COMPONENT_NAME, self._count)
 
     async def _discovery(self, register=True):
-        for sensor_type in self._values:
-            val = self._values[sensor_type]
+        for i, sensor_type in enumerate(self._types):
+            val = self._meta[i]
             if val[_iUNIQUE_NAME]:
                 name = val[_iUNIQUE_NAME]
-            elif len(self._values) > 0:
+            elif len(self._types) > 0:
                 name = "{!s}{!s}".format(self._default_name(), sensor_type[0].upper())
             else:
                 name = self._default_name()
@@ -209,6 +461,8 @@ class ComponentSensor(ComponentBase):
                                                              val[_iVALUE_TEMPLATE],
                                                              expire_after=expire,
                                                              binary=val[_iBINARY_SENSOR])
+            if val[_iAGGREGATE]:
+                tp += DISCOVERY_ATTRIBUTES.format(self._real_topic + "/aggregate", sensor_type)
             if register:
                 await self._publishDiscovery("binary_sensor" if val[_iBINARY_SENSOR] else "sensor",
                                              self.getTopic(sensor_type), name, tp,
@@ -226,25 +480,28 @@ class ComponentSensor(ComponentBase):
         Returns the registered sensor types so other components can check if the
         sensor object supports the type they want to read.
         """
-        return self._values.keys()
+        return self._types
 
-    def _checkType(self, sensor_type):
-        if sensor_type not in self._values:
+    def _checkType(self, sensor_type) -> int:
+        """Returns the index of the sensor_type"""
+        if sensor_type not in self._types:
             raise ValueError("sensor_type {!s} unknown".format(sensor_type))
+        return self._types.index(sensor_type)
 
     async def getValues(self) -> dict:
         """Returns all current values as a dictionary. No read or publish possible"""
-        return dict((x, self._values[x][_iVALUE]) for x in self._values)
+        return dict(zip(self._types, self._vals))
 
     def getTimestamps(self) -> dict:
-        return dict((x, self._values[x][_iTIMESTAMP]) for x in self._values)
+        return dict((x, self.getTimestamp(x)) for x in self._types)
 
     def getTimestamp(self, sensor_type) -> int:
         """Return timestamp of last successful sensor read (last value that was not None)"""
-        self._checkType(sensor_type)
-        return self._values[sensor_type][_iTIMESTAMP]
+        ts = self._ts[self._checkType(sensor_type)]
+        return None if ts == _NO_TIMESTAMP else ts
 
-    async def getValue(self, sensor_type, publish=True, timeout: float = 5, max_age: float = None):
+    async def getValue(self, sensor_type, publish=True, timeout: float = 5, max_age: float = None,
+                       read_timeout: float = None):
         """
         Return last sensor reading of type "sensor_type".
         Only reads sensor if no loop is reading it periodically unless no_stale is True.
@@ -256,35 +513,63 @@ class ComponentSensor(ComponentBase):
         :param timeout: timeout for publishing the value
         :param max_age: Specify how old the value can be. If it is older, the sensor will be read again.
         Makes long intervals possible with other components that rely on having a "live" sensor reading.
+        :param read_timeout: seconds to wait for the sensor reading, None if no value is read in time.
         :return: float or whatever the sensor_type has as a standard, None if no value available
         """
-        self._checkType(sensor_type)
+        i = self._checkType(sensor_type)
         if max_age:
-            if time.ticks_diff(time.ticks_ms(),
-                               self._values[sensor_type][_iTIMESTAMP]) / 1000 > max_age:
+            ts = self._ts[i]
+            if ts == _NO_TIMESTAMP or time.ticks_diff(time.ticks_ms(), ts) / 1000 > max_age:
                 max_age = True
             else:
                 max_age = False
         if max_age or self._intrd == -1:
-            if self._reading:  # if currently reading, don't read again as value will be "live"
-                while self._reading:
-                    await asyncio.sleep_ms(20)
-            else:
-                self._reading = True
-                await self._read()
-                self._reading = False
+            try:
+                await self._readOnce(read_timeout)
+            except asyncio.TimeoutError:
+                return None
             if publish:
                 await self._publishValues(timeout=timeout)
-        return self._values[sensor_type][_iVALUE]
+        return self._vals[i]
+
+    def getHistory(self, sensor_type, since_ms=None) -> list:
+        """
+        Returns the readings kept in RAM, oldest first. Empty if no history is configured.
+        Values are rounded to the precision of the sensor_type as they are stored as float32.
+        :param sensor_type: str representation of the sensor_type.
+        :param since_ms: ticks_ms, e.g. of a previous reading, only newer readings are returned.
+        :return: list of tuples (ticks_ms, value)
+        """
+        i = self._checkType(sensor_type)
+        if self._hist is None or self._hist[i] is None:
+            return []
+        return self._hist[i].get(since_ms, self._meta[i][_iPRECISION])
+
+    def _historyRequest(self, topic, msg, retained):
+        # msg: {"sensor_type": str, "seconds": float}, both optional, or only seconds.
+        # Publishes {sensor_type: [[ms ago, value], ...]} to the topic without /set.
+        if retained:
+            return False
+        if type(msg) in (int, float):
+            msg = {"seconds": msg}
+        elif type(msg) != dict:
+            msg = {}
+        now = time.ticks_ms()
+        since = msg.get("seconds")
+        if since is not None:
+            since = time.ticks_add(now, -int(since * 1000))
+        d = {}
+        for sensor_type in ((msg["sensor_type"],) if "sensor_type" in msg else self._types):
+            d[sensor_type] = [[time.ticks_diff(now, ts), v] for ts, v in
+                              self.getHistory(sensor_type, since)]
+        _mqtt.schedulePublish(topic[:-4], d, qos=1)
+        return False
 
     def getTemplate(self, sensor_type) -> str:
-        self._checkType(sensor_type)
-        return self._values[sensor_type][_iVALUE_TEMPLATE]
+        return self._meta[self._checkType(sensor_type)][_iVALUE_TEMPLATE]
 
     def getTopic(self, sensor_type) -> str:
-        self._checkType(sensor_type)
-        return self._values[sensor_type][_iTOPIC] or self._topic or _mqtt.getDeviceTopic(
-            self._default_name())
+        return self._meta[self._checkType(sensor_type)][_iTOPIC] or self._real_topic
 
     async def _setValue(self, sensor_type, value, timeout=10, log_error=True):
         """
@@ -296,8 +581,8 @@ class ComponentSensor(ComponentBase):
         relevant, then the sensor _read function should not call _setValue if it has no value.
         :return:
         """
-        self._checkType(sensor_type)
-        s = self._values[sensor_type]
+        i = self._checkType(sensor_type)
+        s = self._meta[i]
         if value is not None:
             if type(value) in (int, float):
                 try:
@@ -315,74 +600,82 @@ class ComponentSensor(ComponentBase):
         else:
             if log_error:
                 await self._log.asyncLog("warn", "Got no value for", sensor_type, timeout=timeout)
-        s[_iVALUE] = value
+        self._vals[i] = value
         if value:
-            s[_iTIMESTAMP] = time.ticks_ms()  # time of last successful sensor reading
-
-    async def _loop(self):
-        await asyncio.sleep_ms(random.getrandbits(8) * 2)
-        # delayed start to give network operations and discovery a chance.
-        # also random between 0-2 seconds so not all components run at the same time.
-        d = float("inf") if self._intpb == -1 else (self._intpb / self._intrd)
-        i = d + 1  # so first reading gets published
-        pub_task = None
-
-        def pub(timeout=None):
-            nonlocal pub_task
-            await self._publishValues(timeout)
-            pub_task = None
+            self._ts[i] = time.ticks_ms()  # time of last successful sensor reading
+        if self._hist is not None and self._hist[i] is not None and \
+                type(value) in (int, float, bool):
+            self._hist[i].append(value, time.ticks_ms())
+        if s[_iAGGREGATE] and type(value) in (int, float):
+            a = self._aggr[i]
+            if not a[_aCOUNT] or value < a[_aMIN]:
+                a[_aMIN] = value
+            if not a[_aCOUNT] or value > a[_aMAX]:
+                a[_aMAX] = value
+            a[_aSUM] = (a[_aSUM] if a[_aCOUNT] else 0) + value
+            a[_aCOUNT] += 1
 
+    async def _cycle(self, entry):
+        """Read the sensor and publish the values if needed. Started by the scheduler."""
         try:
-            while True:
-                # d recalculated in loop so _intpb and _intrd can be changed during runtime
-                d = float("inf") if self._intpb == -1 else (self._intpb / self._intrd)
-                pb = i >= d
-                i = 1 if pb else i + 1
-                t = time.ticks_ms()
-                while self._reading:
-                    # wait when sensor is being read because of a getValue(max_age=...) request.
-                    # getValue request could be called with publish=False so can't skip iteration.
-                    await asyncio.sleep_ms(100)
-                self._reading = True
-                res = await self._read()
-                self._reading = False
-                if self._event and res is not False:
-                    self._event.set()
-                if pb and res is not False:
-                    if pub_task and not self._ignore_stale:  # cancel active publish task
-                        pub_task.cancel()
-                        pub_task = None
-                    # start a new publish task.
-                    # Note: if reading interval is lower than publish nees,
-                    # every publish gets canceled or causes OOM situation because the
-                    # tasks can't get canceled quickly enough (waiing for socket lock).
-                    # If self._ignore_stale the current value will be published even if new
-                    # values are available due to higher reading interval.
-                    if pub_task is None:
-                        pub_task = asyncio.create_task(pub(5 if self._ignore_stale else None))
-                # sleep until the sensor should be read again. Using loop with 500ms makes
-                # changing the read interval during runtime possible with a reaction time of 500ms.
-                hs = False
-                while True:
-                    sl = int(self._intrd * 1000 - time.ticks_diff(time.ticks_ms(), t))
-                    sl = 500 if sl > 500 else sl if sl > 0 else 0
-                    if sl == 0 and hs:  # sleeping done
-                        break
-                    # sleeping with 0 lets other coros run in between
-                    await asyncio.sleep_ms(sl)
-                    hs = True
+            # d calculated every reading so _intpb and _intrd can be changed during runtime
+            d = float("inf") if self._intpb == -1 else (self._intpb / self._intrd)
+            pb = self._publish_count >= d
+            self._publish_count = 1 if pb else self._publish_count + 1
+            # if the sensor is being read because of a getValue(max_age=...) request, its
+            # reading is used. It could be called with publish=False so can't skip iteration.
+            res = await self._readOnce()
+            if not pb and res is not False and self._deadbandExceeded():
+                pb = True
+                self._publish_count = 1  # interval_publish is the maximum age of a publication
+            if pb and res is not False:
+                # Readings are queued and replace older readings that haven't been published
+                # yet, so a reading interval lower than a publication needs doesn't result
+                # in a growing amount of tasks waiting for the socket lock.
+                await self._publishValues(5 if self._ignore_stale else None)
+            _scheduler.done(entry)
         except asyncio.CancelledError:
             raise
         except NotImplementedError:
             raise
         except Exception as e:
+            _scheduler.remove(self)  # stop reading like the loop of a sensor did before
             s = io.StringIO()
             sys.print_exception(e, s)
             await self._log.asyncLog("critical",
                                      "Exception in component loop: {!s}".format(s.getvalue()))
+
+    async def _readOnce(self, timeout: float = None):
+        """
+        Read the sensor. If a reading is already in progress, its result is returned instead
+        of reading again, so all concurrent callers share one reading.
+        :param timeout: seconds to wait for the reading, None for no timeout.
+        The reading is not canceled on timeout as other callers might wait for it.
+        :return: result of _read(), raises its exceptions or asyncio.TimeoutError
+        """
+        flight = self._flight
+        if flight is None:
+            flight = self._flight = [asyncio.Event(), False, None]
+            flight[2] = asyncio.create_task(self._readFlight(flight))
+        if timeout is None:
+            await flight[0].wait()
+        else:
+            await asyncio.wait_for_ms(flight[0].wait(), int(timeout * 1000))
+        if isinstance(flight[1], Exception):
+            raise flight[1]
+        return flight[1]
+
+    async def _readFlight(self, flight):
+        try:
+            res = await self._read()
+            if self._event and res is not False:
+                self._event.set()
+            flight[1] = res
+        except Exception as e:  # raised in all callers waiting for the reading
+            flight[1] = e
         finally:
-            if pub_task is not None:
-                pub_task.cancel()
+            self._flight = None
+            flight[0].set()
 
     async def _read(self):
         """
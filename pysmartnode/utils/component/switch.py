@@ -2,8 +2,8 @@
 # Copyright Kevin Köck 2019-2020 Released under the MIT license
 # Created on 2019-09-10 
 
-__updated__ = "2020-04-01"
-__version__ = "1.6"
+__updated__ = "2026-10-18"
+__version__ = "1.8"
 
 from pysmartnode.utils.component import ComponentBase
 from .definitions import DISCOVERY_SWITCH
@@ -39,14 +39,14 @@ class ComponentSwitch(ComponentBase):
             mqtt_topic = "{}{}".format(mqtt_topic, "/set")
         self._topic = mqtt_topic or _mqtt.getDeviceTopic(
             "{!s}{!s}/set".format(component_name, self._count))
-        _mqtt.subscribeSync(self._topic, self.on_message, self, check_retained_state=restore_state)
+        _mqtt.subscribeSync(self._topic, self.on_message, self, check_retained_state=restore_state,
+                            payload_type=_mqtt.PAYLOAD_STR)
         self._lock = asyncio.Lock()
         # in case switch activates a device that will need a while to finish
         self._wfl = wait_for_lock
         self._name = instance_name
         self._event = None
         self._frn = friendly_name
-        self._pub_task = None
         gc.collect()
 
     def getStateChangeEvent(self):
@@ -67,6 +67,8 @@ class ComponentSwitch(ComponentBase):
         """
         Standard callback to change the device state from mqtt.
         Can be subclassed if extended functionality is needed.
+        Payload is received as str, see _mqtt.PAYLOAD_STR. Accepted payloads are
+        "ON", "True", "true", "1" and "OFF", "False", "false", "0" (_mqtt.payload_on/off).
         """
         if msg in _mqtt.payload_on:
             if not self._state:  # False or None (unknown)
@@ -78,9 +80,10 @@ class ComponentSwitch(ComponentBase):
             raise TypeError("Payload {!s} not supported".format(msg))
         return False  # will not publish the requested state to mqtt as already done by on()/off()
 
-    async def _publish(self, msg):
-        await _mqtt.publish(self._topic[:-4], msg, qos=1, retain=True)
-        self._pub_task = None
+    async def _publish(self, msg) -> bool:
+        # queued publication replaces a state that hasn't been published yet.
+        # Returns without waiting for the publication, still a coroutine for subclasses.
+        return _mqtt.schedulePublish(self._topic[:-4], msg, qos=1, retain=True)
 
     async def on(self) -> bool:
         """Turn switch on. Can be used by other components to control this component"""
@@ -93,10 +96,7 @@ class ComponentSwitch(ComponentBase):
         res = await self._on()  # if _on() returns True the value should be published
         if res is True:
             self._setState(True)
-            if self._pub_task:
-                self._pub_task.cancel()
-                self._pub_task = None
-            self._pub_task = asyncio.create_task(self._publish("ON"))
+            await self._publish("ON")
         return res
 
     async def off(self) -> bool:
@@ -110,10 +110,7 @@ class ComponentSwitch(ComponentBase):
         res = await self._off()  # if _off() returns True the value should be published
         if res is True:
             self._setState(False)
-            if self._pub_task:
-                self._pub_task.cancel()
-                self._pub_task = None
-            self._pub_task = asyncio.create_task(self._publish("OFF"))
+            await self._publish("OFF")
         return res
 
     async def toggle(self) -> bool:
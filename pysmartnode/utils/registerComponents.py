@@ -5,8 +5,8 @@ from sys import platform
 import io
 import sys
 
-__updated__ = "2020-04-02"
-__version__ = "0.6"
+__updated__ = "2026-10-18"
+__version__ = "0.7"
 
 if config.DEBUG:
     def __printRAM(start, info=""):
@@ -98,7 +98,7 @@ def registerComponent(componentname, component, _log):
                         obj = None
                         err = True
                     if obj is not None:
-                        COMPONENTS[componentname] = obj
+                        config.addComponent(componentname, obj)
                         # _log.info("Added module {!r} version {!s} as component {!r}".format(
                         #    module_name, version, componentname))
                     elif err is False:  # but no obj because no obj got created as component was a function
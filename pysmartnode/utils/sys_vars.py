@@ -2,7 +2,7 @@
 # Copyright Kevin Köck 2018-2020 Released under the MIT license
 # Created on 2018-02-02
 
-__updated__ = "2020-09-01"
+__updated__ = "2026-10-18"
 
 import os
 import ubinascii
@@ -38,7 +38,14 @@ def hasFilesystem():
     return not os.statvfs("")[0] == 0
 
 
+_device_discovery = None
+
+
 def getDeviceDiscovery():
+    """Returns the device part of discovery messages, only created once"""
+    global _device_discovery
+    if _device_discovery is not None:
+        return _device_discovery
     from pysmartnode import config
     mf = "espressif" if platform in ("esp8266", "esp32") else "None"
     if platform != "linux":
@@ -48,9 +55,7 @@ def getDeviceDiscovery():
             ubinascii.hexlify(s.config("mac"), ":").decode())
     else:
         mac = ""
-    return DISCOVERY_DEVICE_BASE.format(getDeviceID(),
-                                        config.VERSION,
-                                        mf,
-                                        os.uname().sysname if platform != "linux" else "linux",
-                                        config.DEVICE_NAME if config.DEVICE_NAME is not None else getDeviceID(),
-                                        mac)
+    _device_discovery = DISCOVERY_DEVICE_BASE.format(
+        getDeviceID(), config.VERSION, mf, os.uname().sysname if platform != "linux" else "linux",
+        config.DEVICE_NAME if config.DEVICE_NAME is not None else getDeviceID(), mac)
+    return _device_discovery